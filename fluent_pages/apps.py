@@ -9,6 +9,8 @@ class FluentPagesConfig(AppConfig):
     verbose_name = "Fluent Pages"
 
     def ready(self):
+        from fluent_pages import checks  # noqa: F401 (registers the checks)
+
         _register_subclass_types()
 
 
@@ -38,6 +38,10 @@ FLUENT_PAGES_LANGUAGES = getattr(
 
 # Performance settings
 FLUENT_PAGES_PREFETCH_TRANSLATIONS = getattr(settings, "FLUENT_PAGES_PREFETCH_TRANSLATIONS", False)
+FLUENT_PAGES_ROUTING_TABLE = getattr(settings, "FLUENT_PAGES_ROUTING_TABLE", False)
+FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT = getattr(settings, "FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT", 0)
+FLUENT_PAGES_NOT_FOUND_CACHE_SIZE = getattr(settings, "FLUENT_PAGES_NOT_FOUND_CACHE_SIZE", 10000)
+FLUENT_PAGES_DEFER_URL_REBUILD = getattr(settings, "FLUENT_PAGES_DEFER_URL_REBUILD", None)
 
 # Advanced settings
 FLUENT_PAGES_FILTER_SITE_ID = getattr(settings, "FLUENT_PAGES_FILTER_SITE_ID", True)
@@ -45,6 +49,8 @@ FLUENT_PAGES_PARENT_ADMIN_MIXIN = getattr(settings, "FLUENT_PAGES_PARENT_ADMIN_M
 FLUENT_PAGES_CHILD_ADMIN_MIXIN = getattr(settings, "FLUENT_PAGES_CHILD_ADMIN_MIXIN", None)
 
 ROBOTS_TXT_DISALLOW_ALL = getattr(settings, "ROBOTS_TXT_DISALLOW_ALL", settings.DEBUG)
+FLUENT_PAGES_SITEMAP_DIR = getattr(settings, "FLUENT_PAGES_SITEMAP_DIR", None)
+FLUENT_PAGES_SITEMAP_URL = getattr(settings, "FLUENT_PAGES_SITEMAP_URL", "/sitemaps/")
 
 
 # Checks
@@ -72,6 +78,12 @@ else:
         )
 
 
+if FLUENT_PAGES_DEFER_URL_REBUILD not in (None, False, "thread", "command"):
+    raise ImproperlyConfigured(
+        "The setting 'FLUENT_PAGES_DEFER_URL_REBUILD' should be None, 'thread' or 'command'."
+    )
+
+
 # Clean settings
 FLUENT_PAGES_DEFAULT_LANGUAGE_CODE = normalize_language_code(FLUENT_PAGES_DEFAULT_LANGUAGE_CODE)
 
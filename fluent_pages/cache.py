@@ -0,0 +1,188 @@
+"""
+Cache versioning for the page tree.
+
+All caches of fluent_pages derive their keys (or stored values) from per-site version counters.
+Instead of deleting each cache key, changes only increase a version,
+which makes all related caches stale at once.
+There are separate versions for different kinds of changes:
+
+* :data:`TREE`: the structure, URLs and titles of the pages.
+* :data:`PUBLICATION`: which pages are published.
+* :data:`LAYOUT`: the page layouts.
+
+Each increase sends the :data:`~fluent_pages.signals.cache_version_changed` signal,
+so other apps can clear their own caches too.
+After bulk operations that circumvent the model classes (e.g. ``queryset.update()``),
+call :func:`increase_cache_version` to expire everything.
+
+Caches that depend on the published pages can't be cached longer than the next moment a page
+is published or unpublished by its publication dates. Use :func:`get_publication_timeout` for that.
+"""
+import math
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.timezone import now
+
+from fluent_pages.signals import cache_version_changed
+
+__all__ = (
+    "TREE",
+    "PUBLICATION",
+    "LAYOUT",
+    "get_cache_version",
+    "increase_cache_version",
+    "get_tree_version",
+    "increase_tree_version",
+    "get_next_publication_change",
+    "get_publication_timeout",
+    "is_cache_shared",
+)
+
+#: The version scope for the structure, URLs and titles of pages.
+TREE = "tree"
+
+#: The version scope for the publication state of pages.
+PUBLICATION = "publication"
+
+#: The version scope for the page layouts.
+LAYOUT = "layout"
+
+ALL_SCOPES = (TREE, PUBLICATION, LAYOUT)
+
+# The versions for a cache backend that doesn't store values.
+_local_versions = {}
+
+
+def get_cache_version(site_id, scopes=ALL_SCOPES):
+    """
+    Return a version string for the site, which changes when anything in the given scopes changed.
+    This can be used as part of a cache key.
+
+    .. versionadded:: 3.1
+    """
+    cachekeys = [_get_version_key(scope, site_id) for scope in scopes]
+    versions = cache.get_many(cachekeys)
+
+    for cachekey in cachekeys:
+        if cachekey not in versions:
+            # Start with a time-based value, so a version that was evicted from the cache
+            # doesn't restart at a number that other processes might still have seen.
+            version = int(time.time() * 1000000)
+            cache.add(cachekey, version, None)
+            stored = cache.get(cachekey)
+            if stored is None:
+                # The cache doesn't store anything (e.g. DummyCache). Keep the version
+                # in this process, so the caches aren't rebuilt on every call.
+                stored = _local_versions.setdefault(cachekey, version)
+            versions[cachekey] = stored
+
+    return ".".join(str(versions[cachekey]) for cachekey in cachekeys)
+
+
+def increase_cache_version(site_id=None, scopes=ALL_SCOPES):
+    """
+    Mark all caches of the given scopes as stale.
+    When no ``site_id`` is given, the caches of all sites are expired.
+
+    .. versionadded:: 3.1
+    """
+    if site_id is None:
+        from django.contrib.sites.models import Site
+
+        site_ids = list(Site.objects.values_list("pk", flat=True))
+    else:
+        site_ids = [site_id]
+
+    cachekeys = [_get_version_key(scope, site) for scope in scopes for site in site_ids]
+    _increase(cachekeys)
+
+    # When this happens inside a transaction, other processes could rebuild their caches
+    # from the data that is not committed yet. Increase again once the data is visible.
+    transaction.on_commit(lambda: _increase(cachekeys))
+
+    for site in site_ids:
+        cache_version_changed.send(sender=None, site_id=site, scopes=tuple(scopes))
+
+
+def get_tree_version(site_id):
+    """
+    Return the current version of the page tree for a site.
+    """
+    return get_cache_version(site_id, (TREE,))
+
+
+def increase_tree_version(site_id):
+    """
+    Mark all caches of the page tree as stale.
+    """
+    increase_cache_version(site_id, (TREE,))
+
+
+def get_next_publication_change(site_id):
+    """
+    Return the next moment a page of the site is published or unpublished by its publication dates.
+    The result is cached until that moment, or until the publication state of a page changes.
+    """
+    from fluent_pages.models.db import UrlNode
+
+    cachekey = f"fluent_pages.next_publication_change.{site_id}"
+    version = get_cache_version(site_id, (PUBLICATION,))
+    value = cache.get(cachekey)
+    if value is None or value[0] != version:
+        change = UrlNode.objects.parent_site(site_id).next_publication_change()
+        value = (version, change)
+        cache.set(cachekey, value, _get_seconds_until(change))
+
+    return value[1]
+
+
+def get_publication_timeout(site_id, timeout=None):
+    """
+    Return the cache timeout for data that depends on the published pages of a site.
+    This is the number of seconds until the next scheduled publication change,
+    but no longer than ``timeout``. When ``timeout`` is ``None``, it can be cached forever
+    unless a publication change is scheduled.
+    """
+    seconds = _get_seconds_until(get_next_publication_change(site_id))
+    if seconds is None:
+        return timeout
+    elif timeout is None:
+        return seconds
+    else:
+        return min(seconds, timeout)
+
+
+def is_cache_shared():
+    """
+    Return whether the cache backend is shared between processes.
+    With a per-process backend (e.g. ``LocMemCache``), other processes don't notice
+    when a cache version increases, so their caches can't be trusted for long.
+
+    .. versionadded:: 3.1
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (DummyCache, LocMemCache))
+
+
+def _get_seconds_until(date):
+    if date is None:
+        return None
+
+    # Round up, so the cache expires after the page is (un)published.
+    return max(1, math.ceil((date - now()).total_seconds()))
+
+
+def _increase(cachekeys):
+    for cachekey in cachekeys:
+        try:
+            cache.incr(cachekey)
+        except ValueError:
+            # Not stored, the next get_cache_version() call starts with a new value.
+            _local_versions.pop(cachekey, None)
+
+
+def _get_version_key(scope, site_id):
+    return f"fluent_pages.{scope}_version.{site_id}"
@@ -0,0 +1,58 @@
+"""
+System checks for the settings of fluent_pages.
+"""
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+from fluent_pages import appsettings
+from fluent_pages.cache import is_cache_shared
+
+
+@checks.register(checks.Tags.caches)
+def check_cache_backend(app_configs=None, **kwargs):
+    """
+    The routing table and not-found cache are kept in each process,
+    and expired by the cache versions. Those need to be shared between all processes.
+    """
+    names = [
+        name
+        for name in ("FLUENT_PAGES_ROUTING_TABLE", "FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT")
+        if getattr(appsettings, name)
+    ]
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if names and not is_cache_shared():
+        return [
+            checks.Error(
+                f"{' and '.join(names)} requires a cache backend that is shared between processes.",
+                hint=(
+                    f"The default cache uses {type(cache).__name__}, so changes to the pages "
+                    "are not noticed by other processes. Use a backend such as Memcache or Redis."
+                ),
+                obj=type(cache),
+                id="fluent_pages.E001",
+            )
+        ]
+    return []
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs=None, **kwargs):
+    """
+    Without a shared cache, the results of app_reverse() and the state of
+    the URL rebuild queue are not remembered between requests.
+    """
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if not is_cache_shared():
+        return [
+            checks.Warning(
+                "The default cache is not shared between processes, "
+                "so the results of app_reverse() are only remembered during a request.",
+                hint=(
+                    f"The default cache uses {type(cache).__name__}. "
+                    "Use a backend such as Memcache or Redis for faster page lookups."
+                ),
+                obj=type(cache),
+                id="fluent_pages.W001",
+            )
+        ]
+    return []
@@ -1,5 +1,6 @@
 """Internal module for the plugin system, the API is exposed via __init__.py"""
 import re
+from hashlib import md5
 from importlib import import_module
 
 from django import forms
@@ -10,9 +11,11 @@ from django.template.response import TemplateResponse
 from django.urls import URLResolver
 from django.urls.resolvers import RegexPattern
 from django.utils.functional import SimpleLazyObject
+from django.utils.translation import get_language
 
 from fluent_pages import appsettings
 from fluent_pages.adminui import PageAdmin
+from fluent_pages.cache import get_cache_version, get_publication_timeout
 
 __all__ = ("PageTypePlugin",)
 
@@ -101,6 +104,11 @@ class PageTypePlugin(metaclass=forms.MediaDefiningClass):
     #: The sorting priority for the page type in the "Add Page" dialog of the admin.
     sort_priority = 100
 
+    #: .. versionadded:: 3.1
+    #: Defines how many seconds the rendered output of a page can be cached for anonymous visitors.
+    #: The cache is cleared when the page tree changes. By default, responses are not cached.
+    cache_timeout = None
+
     def __init__(self):
         self._type_id = None
         self._url_resolver = None
@@ -165,6 +173,40 @@ class PageTypePlugin(metaclass=forms.MediaDefiningClass):
         context = self.get_context(request, page, **kwargs)
         return self.response_class(request=request, template=render_template, context=context)
 
+    def get_cache_key(self, request, page):
+        """
+        Return the cache key to store the rendered response of the page,
+        or ``None`` when the response should not be cached.
+
+        By default, only ``GET`` and ``HEAD`` requests of anonymous visitors are cached
+        when :attr:`cache_timeout` is set. The key includes the cache version of the site,
+        so all responses are invalidated when a page in the site or a layout is saved or deleted.
+        """
+        if self.cache_timeout is None or request.method not in ("GET", "HEAD"):
+            return None
+
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            return None
+
+        url_hash = md5(request.build_absolute_uri().encode("utf-8")).hexdigest()
+        return "fluent_pages.response.{}.{}.{}.{}.{}.{}".format(
+            page.parent_site_id,
+            get_cache_version(page.parent_site_id),
+            page.pk,
+            page.get_current_language(),
+            get_language(),
+            url_hash,
+        )
+
+    def get_cache_timeout(self, request, page):
+        """
+        Return the number of seconds the rendered response of the page can be cached.
+        By default, this is the :attr:`cache_timeout`, but no longer than the next moment
+        a page in the site is published or unpublished (e.g. menu items may change).
+        """
+        return get_publication_timeout(page.parent_site_id, self.cache_timeout)
+
     def get_render_template(self, request, page, **kwargs):
         """
         Return the template to render for the specific `page` or `request`,
@@ -46,6 +46,7 @@ class PageTypePool:
         self._file_types = None
         self._folder_types = None
         self._url_types = None
+        self._url_plugins_for_name = None
 
     def register(self, plugin):
         """
@@ -73,6 +74,7 @@ class PageTypePool:
         self._folder_types = None
         self._file_types = None
         self._url_types = None
+        self._url_plugins_for_name = None
 
         # Make a single static instance, similar to ModelAdmin.
         plugin_instance = plugin()
@@ -195,6 +197,29 @@ class PageTypePool:
                 plugins.append(plugin)
         return plugins
 
+    def get_url_pattern_plugins_for_name(self, viewname):
+        """
+        Return the :class:`PageTypePlugin` instances that provide a URL pattern
+        with the given name or view function.
+
+        .. versionadded:: 3.1
+        """
+        if self._url_plugins_for_name is None:
+            # Index all URL names once, so reversing doesn't have to try every plugin.
+            index = {}
+            for plugin in self.get_url_pattern_plugins():
+                for name in plugin.get_url_resolver().reverse_dict.keys():
+                    plugins = index.setdefault(name, [])
+                    if plugin not in plugins:
+                        plugins.append(plugin)
+            self._url_plugins_for_name = index  # reset during plugin scan.
+
+        try:
+            return self._url_plugins_for_name.get(viewname, [])
+        except TypeError:
+            # Not a hashable object, so it can't be a view name either.
+            return []
+
     def _import_plugins(self):
         """
         Internal function, ensure all plugin packages are imported.
@@ -5,8 +5,6 @@ import os
 
 from django import forms
 from django.core.exceptions import ValidationError
-from django.urls import reverse
-from django.utils import translation
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from django.utils.translation import get_language
@@ -14,6 +12,7 @@ from django.utils.translation import gettext_lazy as _
 from mptt.forms import TreeNodeChoiceField
 
 from fluent_pages import appsettings
+from fluent_pages.urlresolvers import _get_url_root
 
 
 class TemplateFilePathField(forms.FilePathField):
@@ -85,8 +84,7 @@ class RelativeRootPathField(forms.CharField):
         return value
 
     def get_root(self, value):
-        with translation.override(self.language_code):
-            return reverse("fluent-page").rstrip("/")
+        return _get_url_root(self.language_code)
 
 
 class PageChoiceField(TreeNodeChoiceField):
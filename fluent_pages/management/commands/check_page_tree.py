@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fluent_pages.models.integrity import check_page_tree, fix_tree_problems
+
+
+class Command(BaseCommand):
+    help = "Check the MPTT fields and cached URLs of the page tree."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-s",
+            "--site",
+            type=int,
+            dest="site",
+            default=None,
+            help="Only check the pages of the given site ID.",
+        )
+        parser.add_argument(
+            "-l",
+            "--language",
+            dest="language",
+            default=None,
+            help="Only check the URLs of the given language code.",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            dest="json",
+            default=False,
+            help="Write each problem as JSON object on a separate line.",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            dest="fix",
+            default=False,
+            help="Repair the affected trees and URLs.",
+        )
+
+    def handle(self, *args, **options):
+        site_id = options["site"]
+        problems = []
+        for problem in check_page_tree(site_id=site_id, language_code=options["language"]):
+            problems.append(problem)
+            if options["json"]:
+                self.stdout.write(json.dumps(problem._asdict()))
+            else:
+                self.stdout.write(
+                    "Tree #{0.tree_id}, node #{0.node_id}{1}: {0.kind} should be {0.expected!r}, "
+                    "found {0.found!r}".format(
+                        problem, f" ({problem.language_code})" if problem.language_code else ""
+                    )
+                )
+
+        if not problems:
+            if not options["json"]:
+                self.stdout.write("The page tree is consistent.")
+        elif options["fix"]:
+            fixed = fix_tree_problems(problems, site_id=site_id)
+            self.stderr.write(f"Found {len(problems)} problems, updated {len(fixed)} URLs.")
+        else:
+            raise CommandError(f"Found {len(problems)} problems in the page tree.")
@@ -0,0 +1,56 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from fluent_pages import appsettings
+from fluent_pages.sitemaps import generate_sitemap_files
+
+
+class Command(BaseCommand):
+    help = "Write the sitemaps of the pages to static files."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-s",
+            "--site",
+            type=int,
+            dest="site",
+            default=None,
+            help="Only generate the sitemaps of the given site ID.",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            dest="output",
+            default=None,
+            help="The output directory, defaults to FLUENT_PAGES_SITEMAP_DIR.",
+        )
+        parser.add_argument(
+            "--protocol",
+            dest="protocol",
+            default="https",
+            help="The protocol of the URLs in the sitemap.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            dest="force",
+            default=False,
+            help="Regenerate all files, instead of only the files with changed pages.",
+        )
+
+    def handle(self, *args, **options):
+        output_dir = options["output"] or appsettings.FLUENT_PAGES_SITEMAP_DIR
+        if not output_dir:
+            raise CommandError("No --output given, and FLUENT_PAGES_SITEMAP_DIR is not set.")
+
+        if options["site"] is not None:
+            site_ids = [options["site"]]
+        else:
+            site_ids = Site.objects.values_list("id", flat=True)
+
+        for site_id in site_ids:
+            num_shards = generate_sitemap_files(
+                site_id, output_dir, protocol=options["protocol"], force=options["force"]
+            )
+            self.stdout.write(f"Site #{site_id}: updated {num_shards} sitemap files")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fluent_pages.models.rebuild import process_url_rebuilds
+
+
+class Command(BaseCommand):
+    help = "Update the sub page URLs that were queued by FLUENT_PAGES_DEFER_URL_REBUILD."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-i",
+            "--interval",
+            type=float,
+            dest="interval",
+            default=None,
+            help="Keep running as worker, checking the queue every given number of seconds.",
+        )
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        while True:
+            count = process_url_rebuilds()
+            if count:
+                self.stdout.write(f"Updated the sub pages of {count} pages.")
+
+            if not interval:
+                break
+            time.sleep(interval)
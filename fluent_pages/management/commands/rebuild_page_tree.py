@@ -1,11 +1,18 @@
-from optparse import make_option
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 
+from django.core.cache import cache
 from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.utils.encoding import smart_str
+from parler.cache import get_translation_cache_key
 
 from fluent_pages import appsettings
+from fluent_pages.cache import increase_cache_version
 from fluent_pages.extensions import page_type_pool
-from fluent_pages.models.db import UrlNode, UrlNode_Translation
+from fluent_pages.models.db import PendingUrlRebuild, UrlNode, UrlNode_Translation
 
 
 class Command(BaseCommand):
@@ -33,6 +40,36 @@ class Command(BaseCommand):
             default=False,
             help="Only fix the MPTT fields, leave URLs unchanged.",
         )
+        parser.add_argument(
+            "-s",
+            "--site",
+            type=int,
+            dest="site",
+            default=None,
+            help="Only rebuild the pages of the given site ID.",
+        )
+        parser.add_argument(
+            "-l",
+            "--language",
+            dest="language",
+            default=None,
+            help="Only rebuild the URLs of the given language code.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch-size",
+            default=1000,
+            help="The number of rows that are read and updated at once.",
+        )
+        parser.add_argument(
+            "--parallel",
+            type=int,
+            dest="parallel",
+            default=None,
+            metavar="WORKERS",
+            help="Rebuild the trees concurrently, each tree is committed separately.",
+        )
 
     def handle(self, *args, **options):
         if args:
@@ -40,67 +77,155 @@ class Command(BaseCommand):
 
         is_dry_run = options.get("dry-run", False)
         mptt_only = options.get("mptt-only", False)
-        slugs = {}
-        overrides = {}
-        parents = dict(UrlNode.objects.values_list("id", "parent_id"))
+        site_id = options.get("site")
+        language_code = options.get("language")
+        parallel = options.get("parallel")
+        self.batch_size = options.get("batch-size") or 1000
+        self.verbosity = int(options.get("verbosity", 1))
+        start = time.monotonic()
 
-        self.stdout.write("Updated MPTT columns")
         if is_dry_run and mptt_only:
             # Can't really do anything
             return
 
-        if not is_dry_run:
-            # Fix MPTT first, that is the basis for walking through all nodes.
-            UrlNode.objects.rebuild()
-            self.stdout.write("Updated MPTT columns")
-            if mptt_only:
+        nodes = UrlNode.objects.all()
+        if site_id is not None:
+            nodes = nodes.filter(parent_site=site_id)
+
+        self.type_names = {}
+        self.file_types = {}
+        self.url_prefixes = {}
+        self.active_choices = {}
+        self.col_style = None
+        if not mptt_only:
+            type_len = str(max(len(plugin.type_name) for plugin in page_type_pool.get_plugins()))
+            self.col_style = "| {0:6} | {1:6} | {2:" + type_len + "} | {3:6} | {4}"
+
+        if parallel:
+            # Each tree is rebuilt and committed separately, without locking the whole table.
+            tree_ids = sorted(set(nodes.values_list("tree_id", flat=True)))
+            self.stdout.write(f"Rebuilding {len(tree_ids)} trees with {parallel} workers")
+            # SQLite only allows a single writer, the transactions have to take turns.
+            self.db_lock = threading.Lock() if connection.vendor == "sqlite" else nullcontext()
+            if not mptt_only:
+                self._write_header()
+            totals = [0, 0]
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                futures = [
+                    executor.submit(
+                        self._rebuild_tree, nodes, tree_id, language_code, is_dry_run, mptt_only
+                    )
+                    for tree_id in tree_ids
+                ]
+                for future in as_completed(futures):
+                    counts = future.result()
+                    if counts is None:
+                        return
+                    totals[0] += counts[0]
+                    totals[1] += counts[1]
+            num_rows, num_changed = totals
+        else:
+            if not is_dry_run:
+                # Fix MPTT first, that is the basis for walking through all nodes.
+                if site_id is None:
+                    UrlNode.objects.rebuild()
+                else:
+                    for tree_id in set(nodes.values_list("tree_id", flat=True)):
+                        UrlNode._tree_manager.partial_rebuild(tree_id)
+                self.stdout.write("Updated MPTT columns")
+                if mptt_only:
+                    increase_cache_version(site_id)
+                    return
+
+                self.stdout.write("Updating cached URLs")
+
+            self._write_header()
+            counts = self._update_urls(nodes, language_code, is_dry_run)
+            if counts is None:
                 return
+            num_rows, num_changed = counts
 
-            self.stdout.write("Updating cached URLs")
-            self.stdout.write("Page tree nodes:\n\n")
+        if not is_dry_run:
+            # All URLs are updated now, including those of queued rebuilds.
+            if not mptt_only:
+                pending = PendingUrlRebuild.objects.all()
+                if site_id is not None:
+                    pending = pending.filter(node__parent_site=site_id)
+                if language_code is not None:
+                    pending = pending.filter(language_code=language_code)
+                pending.delete()
 
-        type_len = str(max(len(plugin.type_name) for plugin in page_type_pool.get_plugins()))
-        col_style = "| {0:6} | {1:6} | {2:" + type_len + "} | {3:6} | {4}"
-        header = col_style.format("Site", "Page", "Type", "Locale", "URL")
-        sep = "-" * (len(header) + 40)
-        self.stdout.write(sep)
-        self.stdout.write(header)
-        self.stdout.write(sep)
+            # The tree was updated without the UrlNode.save() logic, expire all caches at once.
+            increase_cache_version(site_id)
 
-        # In a single query, walk through all objects in a logical order,
-        # which traverses through the tree from parent to children.
-        translations = UrlNode_Translation.objects.select_related("master").order_by(
+        if not mptt_only:
+            duration = time.monotonic() - start
+            self.stdout.write(
+                "{} {} of {} URLs in {:.2f}s ({:.0f} translations/s)".format(
+                    "Found changes in" if is_dry_run else "Updated",
+                    num_changed,
+                    num_rows,
+                    duration,
+                    num_rows / duration if duration else 0,
+                )
+            )
+
+    def _rebuild_tree(self, nodes, tree_id, language_code, is_dry_run, mptt_only):
+        # Runs in a worker thread, which has its own database connection.
+        try:
+            with self.db_lock, transaction.atomic():
+                if not is_dry_run:
+                    UrlNode._tree_manager.partial_rebuild(tree_id)
+                if mptt_only:
+                    return (0, 0)
+                return self._update_urls(nodes.filter(tree_id=tree_id), language_code, is_dry_run)
+        finally:
+            connection.close()
+
+    def _update_urls(self, nodes, language_code, is_dry_run):
+        """
+        Update the URLs of the nodes, returns the number of checked and updated translations.
+        """
+        batch_size = self.batch_size
+        translations = UrlNode_Translation.objects.filter(master__in=nodes)
+
+        # Read all slugs in a single pass, the URLs are constructed in memory.
+        # All languages are read, as the URLs can include slugs of fallback languages.
+        parents = dict(nodes.values_list("id", "parent_id").iterator(chunk_size=batch_size))
+        slugs = {}
+        overrides = {}
+        rows = []
+        values = translations.order_by(
             "master__parent_site__id", "master__tree_id", "master__lft", "language_code"
+        ).values_list(
+            "id",
+            "master_id",
+            "language_code",
+            "slug",
+            "override_url",
+            "_cached_url",
+            "master__parent_site_id",
+            "master__polymorphic_ctype_id",
         )
+        for row in values.iterator(chunk_size=batch_size):
+            id, master_id, lang, slug, override_url, old_url, page_site_id, ctype_id = row
+            slugs.setdefault(lang, {})[master_id] = slug
+            overrides.setdefault(lang, {})[master_id] = override_url
+            if language_code is None or lang == language_code:
+                rows.append((id, master_id, lang, old_url, page_site_id, ctype_id))
 
-        for translation in translations:
-            slugs.setdefault(translation.language_code, {})[
-                translation.master_id
-            ] = translation.slug
-            overrides.setdefault(translation.language_code, {})[
-                translation.master_id
-            ] = translation.override_url
-
-            page = translation.master
-            if page.parent_id:
-                if page.parent_id not in slugs[translation.language_code]:
-                    self.stderr.write(
-                        "WARNING: Parent #{} is not translated in '{}', while the child #{} is.".format(
-                            page.parent_id,
-                            translation.language_code,
-                            translation.master_id,
-                        )
+        changed = []
+        for id, master_id, lang, old_url, page_site_id, ctype_id in rows:
+            parent_id = parents[master_id]
+            if parent_id and parent_id not in slugs[lang]:
+                self.stderr.write(
+                    "WARNING: Parent #{} is not translated in '{}', while the child #{} is.".format(
+                        parent_id, lang, master_id
                     )
+                )
 
-            old_url = translation._cached_url
             try:
-                new_url = self._construct_url(
-                    translation.language_code,
-                    translation.master_id,
-                    parents,
-                    slugs,
-                    overrides,
-                )
+                new_url = self._construct_url(lang, master_id, parents, slugs, overrides)
             except KeyError:
                 if is_dry_run:
                     # When the mptt tree is broken, some URLs can't be correctly generated yet.
@@ -109,69 +234,108 @@ class Command(BaseCommand):
                             old_url
                         )
                     )
-                    return
+                    return None
                 raise
 
-            if old_url != new_url:
-                translation._cached_url = new_url
-                if not is_dry_run:
-                    translation.save()
+            if self._is_file(ctype_id) and not overrides[lang][master_id]:
+                # Like UrlNode._update_cached_url(), files don't end with a slash.
+                new_url = new_url[:-1]
 
             if old_url != new_url:
-                self.stdout.write(
-                    smart_str(
-                        "{}  {} {}\n".format(
-                            col_style.format(
-                                page.parent_site_id,
-                                page.pk,
-                                page.plugin.type_name,
-                                translation.language_code,
-                                translation._cached_url,
-                            ),
-                            "WILL CHANGE from" if is_dry_run else "UPDATED from",
-                            old_url,
-                        )
-                    )
+                changed.append((id, master_id, lang, new_url))
+                self._write_row(
+                    page_site_id,
+                    master_id,
+                    ctype_id,
+                    lang,
+                    new_url,
+                    "{} {}".format("WILL CHANGE from" if is_dry_run else "UPDATED from", old_url),
                 )
-            else:
-                self.stdout.write(
-                    smart_str(
-                        col_style.format(
-                            page.parent_site_id,
-                            page.pk,
-                            page.plugin.type_name,
-                            translation.language_code,
-                            translation._cached_url,
-                        )
-                    )
+            elif self.verbosity >= 2:
+                self._write_row(page_site_id, master_id, ctype_id, lang, new_url)
+
+        if not is_dry_run:
+            for i in range(0, len(changed), batch_size):
+                batch = changed[i : i + batch_size]
+                objs = [UrlNode_Translation(id=id, _cached_url=url) for id, _, _, url in batch]
+                UrlNode_Translation.objects.bulk_update(objs, ["_cached_url"])
+
+                # The translations are updated without their save() method,
+                # remove the objects that django-parler cached.
+                cache.delete_many(
+                    [
+                        get_translation_cache_key(UrlNode_Translation, master_id, lang)
+                        for _, master_id, lang, _ in batch
+                    ]
                 )
 
+        return (len(rows), len(changed))
+
+    def _is_file(self, ctype_id):
+        try:
+            return self.file_types[ctype_id]
+        except KeyError:
+            plugin = page_type_pool._get_plugin_by_content_type(ctype_id)
+            is_file = self.file_types[ctype_id] = plugin.is_file
+            return is_file
+
+    def _write_header(self):
+        if self.verbosity >= 2:
+            self.stdout.write("Page tree nodes:\n\n")
+
+        header = self.col_style.format("Site", "Page", "Type", "Locale", "URL")
+        sep = "-" * (len(header) + 40)
+        self.stdout.write(sep)
+        self.stdout.write(header)
+        self.stdout.write(sep)
+
+    def _write_row(self, site_id, page_id, ctype_id, language_code, url, message=""):
+        try:
+            type_name = self.type_names[ctype_id]
+        except KeyError:
+            plugin = page_type_pool._get_plugin_by_content_type(ctype_id)
+            type_name = self.type_names[ctype_id] = plugin.type_name
+
+        line = self.col_style.format(site_id, page_id, type_name, language_code, url)
+        if message:
+            line = f"{line}  {message}\n"
+        self.stdout.write(smart_str(line))
+
     def _construct_url(self, language_code, child_id, parents, slugs, overrides):
-        active_choices = appsettings.FLUENT_PAGES_LANGUAGES.get_active_choices(language_code)
+        prefix = self._get_url_prefix(language_code, child_id, parents, slugs, overrides)
+        return (prefix + "/").replace("//", "/")
+
+    def _get_url_prefix(self, language_code, child_id, parents, slugs, overrides):
+        # The URL of each node is memoized, so a child only appends its slug to the parent URL.
+        # As the rows are processed in tree order, the parent is typically known already.
+        try:
+            active_choices = self.active_choices[language_code]
+        except KeyError:
+            active_choices = appsettings.FLUENT_PAGES_LANGUAGES.get_active_choices(language_code)
+            self.active_choices[language_code] = active_choices
 
+        prefixes = self.url_prefixes.setdefault(language_code, {None: ""})
         breadcrumb = []
         cur = child_id
-        while cur is not None:
-            breadcrumb.insert(0, cur)
+        while cur not in prefixes:
+            breadcrumb.append(cur)
             cur = parents[cur]
 
-        url_parts = [""]
-        for id in breadcrumb:
-            try:
-                # Resets url_parts
-                override = overrides[language_code][id]
-                if override:
-                    url_parts = [override]
-                    continue
-            except KeyError:
-                pass
+        prefix = prefixes[cur]
+        for id in reversed(breadcrumb):
+            # Resets the URL
+            override = overrides.get(language_code, {}).get(id)
+            if override:
+                prefix = override
+            else:
+                # Add first one found, preferably the normal language, fallback otherwise.
+                for lang in active_choices:
+                    try:
+                        prefix = f"{prefix}/{slugs[lang][id]}"
+                        break
+                    except KeyError:
+                        continue
 
-            # Add first one found, preferably the normal language, fallback otherwise.
-            for lang in active_choices:
-                try:
-                    url_parts.append(slugs[lang][id])
-                    break
-                except KeyError:
-                    continue
+            prefixes[id] = prefix
 
-        return ("/".join(url_parts) + "/").replace("//", "/")
+        return prefix
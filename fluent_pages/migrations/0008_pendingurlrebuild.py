@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluent_pages', '0007_use_parler_transactionsfk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUrlRebuild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language_code', models.CharField(db_index=True, max_length=15, verbose_name='language')),
+                ('old_url', models.CharField(max_length=255)),
+                ('new_url', models.CharField(max_length=255)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='fluent_pages.urlnode')),
+            ],
+            options={
+                'verbose_name': 'Pending URL rebuild',
+                'verbose_name_plural': 'Pending URL rebuilds',
+                'ordering': ('id',),
+                'unique_together': {('node', 'language_code')},
+            },
+        ),
+    ]
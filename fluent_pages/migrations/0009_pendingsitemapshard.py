@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0001_initial'),
+        ('fluent_pages', '0008_pendingurlrebuild'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSitemapShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveIntegerField(verbose_name='shard')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('parent_site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.site')),
+            ],
+            options={
+                'verbose_name': 'Pending sitemap file',
+                'verbose_name_plural': 'Pending sitemap files',
+                'ordering': ('id',),
+                'unique_together': {('parent_site', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluent_pages', '0009_pendingsitemapshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingurlrebuild',
+            name='failed',
+            field=models.BooleanField(default=False, verbose_name='failed'),
+        ),
+    ]
@@ -4,10 +4,14 @@ The data layer of the CMS, exposing all database models.
 The objects can be imported from the main package.
 There are several sub packages:
 
+    bulk: Creating page trees in bulk
     db: The database models
+    integrity: Checking the consistency of the page tree
     managers: Additional manager classes
     modeldata: Classes that expose model data in a sane way (for template designers)
     navigation: The menu navigation nodes (for template designers)
+    rebuild: The deferred rebuilding of sub page URLs
+    routing: The in-process routing table to resolve URLs
 """
 
 # Like django.db.models, or django.forms,
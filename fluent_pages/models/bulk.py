@@ -0,0 +1,263 @@
+"""
+Creating page trees in bulk.
+
+Saving a single page runs several queries; to insert the node in the MPTT tree,
+make the slug unique, read the URL of the parent and expire the caches.
+:func:`bulk_create_tree` does all of that in memory instead,
+and fills each table with a few bulk inserts. This is meant for importing large sites.
+"""
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.template.defaultfilters import slugify
+from parler.cache import is_missing
+
+from fluent_pages import appsettings
+from fluent_pages.cache import PUBLICATION, TREE, increase_cache_version
+
+__all__ = ("bulk_create_tree",)
+
+
+@transaction.atomic
+def bulk_create_tree(tree, parent=None, batch_size=500):
+    """
+    Create a tree of new pages at once.
+
+    The ``tree`` is a list of unsaved pages, or ``(page, children)`` tuples
+    where ``children`` is a list in the same format. The translations are assigned to the pages
+    as usual (e.g. with :func:`~parler.models.TranslatableModel.set_current_language`).
+    The pages are added as last children of the ``parent``, or as new root nodes.
+
+    Like :func:`UrlNode.save() <fluent_pages.models.UrlNode.save>`, the slugs are made unique
+    and the URLs are generated. However, the ``save()`` method is not called
+    and no ``pre_save`` or ``post_save`` signals are sent.
+    Like ``save()``, a :class:`~fluent_pages.models.ParentTranslationDoesNotExist` error is raised
+    when a page is translated in a language that its parent doesn't have.
+    Unlike ``save()``, the parent types are validated too:
+    a :class:`~django.core.exceptions.ValidationError` is raised when a parent
+    can't have children, or doesn't allow the page type as child.
+
+    Returns all created pages, in tree order.
+    """
+    from fluent_pages.models.db import UrlNode, UrlNode_Translation
+
+    levels = {}
+    if parent is None:
+        tree_id = UrlNode._tree_manager._get_next_tree_id()
+        for item in tree:
+            _add_nodes(levels, [item], None, tree_id, 0, 1)
+            tree_id += 1
+    else:
+        # Read the current position of the parent, make room for the new nodes.
+        parent.tree_id, parent.rght, parent.level, parent.parent_site_id = (
+            UrlNode.objects.filter(pk=parent.pk)
+            .values_list("tree_id", "rght", "level", "parent_site_id")
+            .get()
+        )
+        end = _add_nodes(levels, tree, parent, parent.tree_id, parent.level + 1, parent.rght)
+        size = end - parent.rght
+        UrlNode._tree_manager._create_space(size, parent.rght - 1, parent.tree_id)
+        parent.rght += size
+
+    nodes = sorted((node for level in levels.values() for node in level), key=_tree_order)
+    if not nodes:
+        return []
+
+    translations = _prepare_translations(nodes, parent)
+
+    # Each level needs the primary keys of the previous level for the parent field.
+    for level in sorted(levels):
+        level_nodes = levels[level]
+        UrlNode.objects.bulk_create(level_nodes, batch_size=batch_size)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            rows = UrlNode.objects.filter(
+                tree_id__in={node.tree_id for node in level_nodes}, level=level
+            ).values_list("tree_id", "lft", "id")
+            ids = {(tree_id, lft): id for tree_id, lft, id in rows}
+            for node in level_nodes:
+                node.id = ids[(node.tree_id, node.lft)]
+
+        for node in level_nodes:
+            for model in _get_page_type_models(node):
+                setattr(node, model._meta.pk.attname, node.id)
+
+    # The tables of the page type models, which can't be filled by bulk_create().
+    # This uses the private QuerySet._insert(), which bulk_create() uses internally as well.
+    # Tested with Django 4.2 and django-polymorphic 3.1; the (objs, fields) arguments
+    # are unchanged since Django 2.2, and polymorphic doesn't override _insert().
+    rows = {}
+    for node in nodes:
+        for model in _get_page_type_models(node):
+            rows.setdefault(model, []).append(node)
+    for model, objs in rows.items():
+        fields = model._meta.local_concrete_fields
+        for start in range(0, len(objs), batch_size):
+            model._base_manager._insert(objs[start : start + batch_size], fields=fields)
+
+    for model, objs in translations.items():
+        model.objects.bulk_create(objs, batch_size=batch_size)
+
+    for translation in translations.get(UrlNode_Translation, ()):
+        translation._original_cached_url = translation._cached_url
+
+    for node in nodes:
+        node._original_parent = node.parent_id
+        node._original_pub_date = node.publication_date
+        node._original_pub_end_date = node.publication_end_date
+        node._original_status = node.status
+
+    site_nodes = {}
+    for node in nodes:
+        site_nodes.setdefault(node.parent_site_id, []).append(node.pk)
+    for site_id, node_ids in site_nodes.items():
+        increase_cache_version(site_id, (TREE, PUBLICATION))
+        if appsettings.FLUENT_PAGES_SITEMAP_DIR:
+            from fluent_pages.sitemaps import mark_sitemap_changed
+
+            mark_sitemap_changed(site_id, node_ids)
+
+    return nodes
+
+
+def _add_nodes(levels, items, parent, tree_id, level, lft):
+    # Assign the MPTT fields in memory, returns the next free "lft" value.
+    for item in items:
+        node, children = item if isinstance(item, tuple) else (item, ())
+        if node.pk is not None:
+            raise ValueError(f"Can't add {node!r} to the tree, it's already saved.")
+
+        if parent is not None:
+            _validate_parent(node, parent)
+            node.parent_site_id = parent.parent_site_id
+        node.parent = parent
+        node.tree_id = tree_id
+        node.level = level
+        node.lft = lft
+        node.rght = _add_nodes(levels, children, node, tree_id, level + 1, lft + 1)
+        lft = node.rght + 1
+        levels.setdefault(level, []).append(node)
+    return lft
+
+
+def _validate_parent(node, parent):
+    # The checks of PageTreeForeignKey, which save() leaves to full_clean().
+    # A bulk import has no form to report these errors, so the tree is checked here.
+    error_messages = node._meta.get_field("parent").error_messages
+    if not parent.can_have_children:
+        raise ValidationError(error_messages["no_children_allowed"])
+    if not parent.is_child_allowed(node):
+        raise ValidationError(error_messages["child_not_allowed"])
+
+
+def _tree_order(node):
+    return (node.tree_id, node.lft)
+
+
+def _get_page_type_models(node):
+    # The concrete models between UrlNode and the page type, from top to bottom.
+    from fluent_pages.models.db import UrlNode
+
+    models = [node._meta.concrete_model] + node._meta.get_parent_list()
+    return [model for model in reversed(models) if model is not UrlNode]
+
+
+def _prepare_translations(nodes, parent):
+    # Make the slugs unique and generate the URLs, like UrlNode.save_translation() does.
+    # The nodes are in tree order, so the URL of the parent is always known.
+    from fluent_pages.models.db import ParentTranslationDoesNotExist, UrlNode_Translation
+
+    translations = {}
+    parent_urls = {}
+    sibling_slugs = _read_sibling_slugs(nodes, parent)
+    if parent is not None:
+        parent_urls[id(parent)] = dict(
+            UrlNode_Translation.objects.filter(master=parent.pk).values_list(
+                "language_code", "_cached_url"
+            )
+        )
+
+    for node in nodes:
+        node_urls = parent_urls[id(node)] = {}
+        for meta in node._parler_meta:
+            for translation in node._translations_cache[meta.model].values():
+                if is_missing(translation):
+                    continue
+
+                translation.master = node
+                translations.setdefault(meta.model, []).append(translation)
+                if meta.model is not UrlNode_Translation:
+                    continue
+
+                language_code = translation.language_code
+                if not translation.slug:
+                    if not translation.title:
+                        raise ValueError(
+                            f"No slug or title given for {node!r} in '{language_code}'"
+                        )
+                    translation.slug = slugify(translation.title)
+
+                key = _get_sibling_key(node, language_code)
+                taken = sibling_slugs.setdefault(key, set())
+                origslug = translation.slug
+                dupnr = 1
+                while translation.slug in taken:
+                    dupnr += 1
+                    translation.slug = "%s-%d" % (origslug, dupnr)
+                taken.add(translation.slug)
+
+                if translation.override_url:
+                    translation._cached_url = translation.override_url
+                else:
+                    if node.parent is None:
+                        parent_url = "/"
+                    else:
+                        # Like get_parent_cached_url(use_fallback=False) in save(),
+                        # the parent needs to have a URL in the same language.
+                        urls = parent_urls[id(node.parent)]
+                        parent_url = urls.get(language_code)
+                        if not parent_url:
+                            raise ParentTranslationDoesNotExist(
+                                "Can't determine URL for {!r} in '{}', the parent only has URLs in {}.".format(
+                                    node, language_code, ", ".join(urls) or "no languages"
+                                )
+                            )
+                        if not parent_url[-1] == "/":
+                            parent_url += "/"
+
+                    if node.is_file:
+                        translation._cached_url = f"{parent_url}{translation.slug}"
+                    else:
+                        translation._cached_url = f"{parent_url}{translation.slug}/"
+
+                node_urls[language_code] = translation._cached_url
+
+    return translations
+
+
+def _read_sibling_slugs(nodes, parent):
+    # The existing pages that are siblings of the new top level nodes, fetched in a single query.
+    from fluent_pages.models.db import UrlNode_Translation
+
+    top_nodes = [node for node in nodes if node.parent is parent]
+    existing = UrlNode_Translation.objects.filter(
+        master__parent=parent.pk if parent is not None else None
+    )
+    if appsettings.FLUENT_PAGES_FILTER_SITE_ID:
+        existing = existing.filter(
+            master__parent_site__in={node.parent_site_id for node in top_nodes}
+        )
+
+    sibling_slugs = {}
+    rows = existing.values_list("master__parent_site", "language_code", "slug")
+    for site_id, language_code, slug in rows:
+        key = _get_sibling_key(top_nodes[0], language_code, site_id=site_id)
+        sibling_slugs.setdefault(key, set()).add(slug)
+    return sibling_slugs
+
+
+def _get_sibling_key(node, language_code, site_id=None):
+    # The slugs need to be unique per parent, and per site for the root nodes.
+    if appsettings.FLUENT_PAGES_FILTER_SITE_ID:
+        site_id = site_id or node.parent_site_id
+    else:
+        site_id = None
+    return (id(node.parent) if node.parent is not None else None, site_id, language_code)
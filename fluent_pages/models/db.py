@@ -10,6 +10,7 @@ It defines the following classes:
   The layout of a page, which has regions and a template.
 """
 import logging
+import re
 
 from django.conf import settings
 from django.contrib.sites.models import Site
@@ -17,12 +18,13 @@ from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.db import connection, models, transaction
 from django.db.backends.utils import truncate_name
+from django.db.models import Q
 from django.template.defaultfilters import slugify
-from django.urls import NoReverseMatch, reverse
+from django.urls import NoReverseMatch
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from fluent_utils.softdeps.any_imagefield import AnyImageField
-from parler.cache import get_object_cache_keys
+from parler.cache import get_object_cache_keys, get_translation_cache_key, is_missing
 from parler.fields import TranslatedField, TranslationsForeignKey
 from parler.models import TranslatableModel, TranslatedFields, TranslatedFieldsModel
 from parler.utils import get_language_title
@@ -31,8 +33,11 @@ from polymorphic_tree.models import PolymorphicMPTTModel, PolymorphicMPTTModelBa
 from slug_preview.models import SlugPreviewField
 
 from fluent_pages import appsettings
+from fluent_pages.cache import LAYOUT, PUBLICATION, TREE, increase_cache_version
 from fluent_pages.models.fields import PageTreeForeignKey, TemplateFilePathField
 from fluent_pages.models.managers import UrlNodeManager
+from fluent_pages.models.rebuild import queue_url_rebuild
+from fluent_pages.urlresolvers import _get_url_root
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +46,26 @@ def _get_current_site():
     return Site.objects.get_current().pk
 
 
+def _is_file_type(ctype_id, file_types):
+    # Check whether the page type is a file, the results are cached in the file_types dict.
+    try:
+        return file_types[ctype_id]
+    except KeyError:
+        from fluent_pages.extensions import page_type_pool
+
+        plugin = page_type_pool._get_plugin_by_content_type(ctype_id)
+        is_file = file_types[ctype_id] = plugin.is_file
+        return is_file
+
+
+def _has_absolute_url_override(model):
+    # Django replaces get_absolute_url() of the model and its subclasses for ABSOLUTE_URL_OVERRIDES.
+    overrides = settings.ABSOLUTE_URL_OVERRIDES
+    return bool(overrides) and any(
+        cls._meta.label_lower in overrides for cls in model.__mro__ if hasattr(cls, "_meta")
+    )
+
+
 class TreeInconsistencyError(RuntimeError):
     pass
 
@@ -202,6 +227,7 @@ class UrlNode(AbstractUrlNode):
         self._original_pub_end_date = None
         self._original_status = None
         self._original_parent = None
+        self._in_save = False
 
         deferred = self.get_deferred_fields()
         if "publication_date" not in deferred:
@@ -214,6 +240,7 @@ class UrlNode(AbstractUrlNode):
             self._original_parent = self.parent_id
 
         self._cached_ancestors = None
+        self._sibling_slugs = {}  # Filled during save()
         self.is_current = None  # Can be defined by mark_current()
         # Set is_onpath to None, this is an ancestor of the current node (part of the "menu trail").
         self.is_onpath = None
@@ -235,19 +262,48 @@ class UrlNode(AbstractUrlNode):
 
         # Extra for django-slug-preview
         if self.parent_id:
-            # TODO: optimize this call. In some cases this would also work..
-            #       that is, unless get_absolute_url() is redefined or ABSOLUTE_URL_OVERRIDES was used.
-            # parent_url = self.get_translation(self.get_current_language()).get_parent_cached_url(self)
-
-            # Need to fetch the whole parent to make sure the URL matches the actual URL being used.
-            parent = self.parent
-            with switch_language(parent, self.get_current_language()):
-                parent_url = parent.get_absolute_url()
+            parent_url = self._read_parent_url()
+            if parent_url is None:
+                # The URL of the parent is customized by get_absolute_url() or ABSOLUTE_URL_OVERRIDES.
+                # Need to fetch the whole parent to make sure the URL matches the actual URL being used.
+                parent = self.parent
+                with switch_language(parent, self.get_current_language()):
+                    parent_url = parent.get_absolute_url()
 
             return parent_url.rstrip("/") + url_format
         else:
             return url_format
 
+    def _read_parent_url(self):
+        """
+        Read the URL of the parent, without fetching the polymorphic parent object.
+        Returns ``None`` when the parent URL can't be determined from its cached URL.
+        """
+        from fluent_pages.extensions import page_type_pool
+
+        language_code = self.get_current_language()
+        language_codes = appsettings.FLUENT_PAGES_LANGUAGES.get_active_choices(language_code)
+        urls = {}
+        ctype_id = None
+        for lang, cached_url, ctype_id in UrlNode_Translation.objects.filter(
+            master=self.parent_id, language_code__in=language_codes
+        ).values_list("language_code", "_cached_url", "master__polymorphic_ctype_id"):
+            urls[lang] = cached_url
+
+        if ctype_id is None:
+            return None
+
+        model = page_type_pool._get_plugin_by_content_type(ctype_id).model
+        if model.get_absolute_url is not UrlNode.get_absolute_url or _has_absolute_url_override(
+            model
+        ):
+            return None
+
+        for lang in language_codes:
+            if urls.get(lang) is not None:
+                return _get_url_root(language_code) + urls[lang]
+        return None
+
     @property
     def default_url(self):
         """
@@ -258,30 +314,36 @@ class UrlNode(AbstractUrlNode):
             ABSOLUTE_URL_OVERRIDES = {
                 'fluent_pages.Page': lambda o: "http://example.com" + o.default_url
             }
+
+        .. versionchanged:: 3.1 The URL root of the pages is resolved once per language.
         """
-        with switch_language(self):
-            try:
-                root = reverse("fluent-page").rstrip("/")
-            except NoReverseMatch:
-                raise ImproperlyConfigured(
-                    "Missing an include for 'fluent_pages.urls' in the URLConf"
-                )
+        try:
+            root = _get_url_root(self.get_current_language())
+        except NoReverseMatch:
+            raise ImproperlyConfigured("Missing an include for 'fluent_pages.urls' in the URLConf")
 
-            cached_url = self._cached_url  # May raise TranslationDoesNotExist
-            if cached_url is None:
-                return None  # translation is just created, but not yet filled in.
+        cached_url = self._cached_url  # May raise TranslationDoesNotExist
+        if cached_url is None:
+            return None  # translation is just created, but not yet filled in.
 
-            return root + cached_url
+        return root + cached_url
 
     def get_absolute_urls(self):
         """
         Return all available URLs to this page.
+
+        .. versionchanged:: 3.1 No query is needed when the translations are prefetched,
+           e.g. with :func:`~fluent_pages.models.managers.UrlNodeQuerySet.with_all_urls`.
         """
+        prefetched = getattr(self, "_prefetched_objects_cache", {}).get("translations")
+        if prefetched is not None:
+            rows = [(t.language_code, t._cached_url) for t in prefetched]
+        else:
+            rows = self.translations.values_list("language_code", "_cached_url")
+
         result = {}
-        for code, cached_url in self.translations.values_list("language_code", "_cached_url"):
-            with switch_language(self, code):
-                root = reverse("fluent-page").rstrip("/")
-                result[code] = root + cached_url
+        for code, cached_url in rows:
+            result[code] = _get_url_root(code) + cached_url
 
         return result
 
@@ -309,10 +371,13 @@ class UrlNode(AbstractUrlNode):
     def breadcrumb(self):
         """
         Return the breadcrumb; all parent pages leading to the current page, including current page itself.
+
+        .. versionchanged:: 3.1 The translations of the parent pages are fetched at once.
         """
-        # Cache ancestors, we need them more often
+        # Cache ancestors, we need them more often.
+        # The translations are prefetched, so reading the title/url doesn't run a query per ancestor.
         if not self._cached_ancestors:
-            self._cached_ancestors = list(self.get_ancestors())
+            self._cached_ancestors = list(self.get_ancestors().prefetch_related("translations"))
 
         nodes = self._cached_ancestors[:]
         nodes.append(self)
@@ -427,6 +492,11 @@ class UrlNode(AbstractUrlNode):
         if parent_changed:
             self._mark_all_translations_dirty()
 
+        # The parent could be changed, the slugs of other pages could be changed.
+        self._sibling_slugs = {}
+
+        # The caches are expired once below, instead of for every saved translation.
+        self._in_save = True
         try:
             # This already saves translated model.
             super().save(*args, **kwargs)
@@ -438,6 +508,13 @@ class UrlNode(AbstractUrlNode):
             if parent_changed:
                 self._unmark_all_translations_dirty()
             raise
+        finally:
+            self._in_save = False
+
+        # The publication state and ordering are not part of the translations,
+        # make sure caches are also cleared when no translation was saved.
+        self._expire_url_caches()
+        self._mark_sitemap_changed()
 
         # Update state for next save (if object is persistent somewhere)
         self._original_parent = self.parent_id
@@ -491,19 +568,21 @@ class UrlNode(AbstractUrlNode):
         self._make_slug_unique(translation)
         self._update_cached_url(translation)
         url_changed = translation.is_cached_url_modified
+        old_url = translation._original_cached_url
         super().save_translation(translation, *args, **kwargs)
 
         # Detect changes
-        published_changed = (
-            self._original_pub_date != self.publication_date
-            or self._original_pub_end_date != self.publication_end_date
-            or self._original_status != self.status
-        )
+        published_changed = self._is_publication_changed()
 
         if url_changed or published_changed or translation._fetched_parent_url:
-            self._expire_url_caches()
-
-            if url_changed:
+            if not self._in_save:
+                self._expire_url_caches()
+
+            if url_changed and old_url and appsettings.FLUENT_PAGES_DEFER_URL_REBUILD:
+                # Large sections can take a while, update the sub pages later.
+                if not self.is_leaf_node():
+                    queue_url_rebuild(self, translation, old_url)
+            elif url_changed:
                 # Performance optimisation: only traversing and updating many records when something changed in the URL.
                 try:
                     self._update_decendant_urls(translation)
@@ -515,8 +594,24 @@ class UrlNode(AbstractUrlNode):
                     raise TreeInconsistencyError(msg)
 
     def delete(self, *args, **kwargs):
+        pk = self.pk
         super().delete(*args, **kwargs)
-        self._expire_url_caches()
+        increase_cache_version(self.parent_site_id, (TREE, PUBLICATION))
+        self._mark_sitemap_changed([pk])
+
+    def _mark_sitemap_changed(self, node_ids=None):
+        # Only track the changes when the sitemap files are generated.
+        if appsettings.FLUENT_PAGES_SITEMAP_DIR:
+            from fluent_pages.sitemaps import mark_sitemap_changed
+
+            mark_sitemap_changed(self.parent_site_id, node_ids or [self.pk])
+
+    def _is_publication_changed(self):
+        return (
+            self._original_pub_date != self.publication_date
+            or self._original_pub_end_date != self.publication_end_date
+            or self._original_status != self.status
+        )
 
     # Following of the principles for "clean code"
     # the save() method is split in the 3 methods below,
@@ -527,26 +622,49 @@ class UrlNode(AbstractUrlNode):
         Check for duplicate slugs at the same level, and make the current object unique.
         """
         origslug = translation.slug
-        dupnr = 1
-        while True:
-            others = UrlNode.objects.filter(
-                parent=self.parent_id,
-                translations__slug=translation.slug,
-                translations__language_code=translation.language_code,
-            ).non_polymorphic()
-
-            if appsettings.FLUENT_PAGES_FILTER_SITE_ID:
-                others = others.parent_site(self.parent_site_id)
-
-            if self.pk:
-                others = others.exclude(pk=self.pk)
-
-            if not others.count():
-                break
+        key = (translation.language_code, origslug)
+        if key not in self._sibling_slugs:
+            self._read_sibling_slugs(translation)
 
+        # Pick the first free suffix in memory.
+        taken = self._sibling_slugs[key]
+        dupnr = 1
+        while translation.slug in taken:
             dupnr += 1
             translation.slug = "%s-%d" % (origslug, dupnr)
 
+    def _read_sibling_slugs(self, translation):
+        """
+        Fetch the slugs of the pages at the same level which could conflict.
+        This is done in a single query for all translations that are saved at once.
+        """
+        keys = {(translation.language_code, translation.slug)}
+        for other in self._translations_cache[UrlNode_Translation].values():
+            if not is_missing(other) and other is not translation:
+                slug = other.slug or slugify(other.title or "")  # same as save_translation()
+                if slug:
+                    keys.add((other.language_code, slug))
+        keys -= set(self._sibling_slugs)
+
+        query = Q()
+        for language_code, slug in keys:
+            query |= Q(language_code=language_code, slug__startswith=slug)
+
+        others = UrlNode_Translation.objects.filter(query, master__parent=self.parent_id)
+        if appsettings.FLUENT_PAGES_FILTER_SITE_ID:
+            others = others.filter(master__parent_site=self.parent_site_id)
+        if self.pk:
+            others = others.exclude(master=self.pk)
+
+        # Only the slug itself and the numbered variants ("slug-2") can conflict.
+        patterns = {key: re.compile(r"^{}(-\d+)?$".format(re.escape(key[1]))) for key in keys}
+        for key in keys:
+            self._sibling_slugs[key] = set()
+        for language_code, slug in others.values_list("language_code", "slug"):
+            for key, pattern in patterns.items():
+                if key[0] == language_code and pattern.match(slug):
+                    self._sibling_slugs[key].add(slug)
+
     def _update_cached_url(self, translation):
         """
         Update the URLs
@@ -578,6 +696,8 @@ class UrlNode(AbstractUrlNode):
         """
         Update the URLs of all decendant pages.
         The method is only called when the URL has changed.
+
+        .. versionchanged:: 3.1 The URLs are calculated in memory, and stored with a bulk update.
         """
         # Fetch the language settings.
         # By using get_active_choices() instead of get_fallback_language()/get_fallback_languages(),
@@ -603,55 +723,79 @@ class UrlNode(AbstractUrlNode):
             else:
                 cached_page_urls[lang] = {self.id: fallback_url.rstrip("/") + "/"}
 
-        # Update all sub objects.
+        # Read the translations of all sub objects in a single query.
         # even if can_have_children is false, ensure a consistent state for the URL structure
-        subobjects = self.get_descendants().order_by("lft", "tree_id")
-        for subobject in subobjects:
-            if subobject.has_translation(current_language):
+        subobjects = {}
+        rows = (
+            UrlNode_Translation.objects.filter(
+                master__tree_id=self.tree_id,
+                master__lft__gt=self.lft,
+                master__rght__lt=self.rght,
+                language_code__in=active_choices,
+            )
+            .order_by("master__lft")
+            .values_list(
+                "master_id",
+                "master__parent_id",
+                "language_code",
+                "master__polymorphic_ctype_id",
+                "id",
+                "slug",
+                "override_url",
+                "_cached_url",
+            )
+        )
+        for master_id, parent_id, language_code, ctype_id, *values in rows.iterator():
+            subobject = subobjects.setdefault(master_id, (parent_id, ctype_id, {}))
+            subobject[2][language_code] = values
+
+        # Calculate all new URLs in memory, following the tree from parent to children.
+        changed = []
+        file_types = {}
+        for subobject_id, (parent_id, ctype_id, translations) in subobjects.items():
+            if current_language in translations:
                 # Subobject has the current translation. Use that
                 # If the level in between does not have that translation, will use the fallback instead.
-                subobject.set_current_language(current_language)
-                use_fallback_base = (
-                    cached_page_urls[current_language].get(subobject.parent_id) is None
-                )
+                use_fallback_base = cached_page_urls[current_language].get(parent_id) is None
             else:
                 # The subobject is not yet translated in the parent's language.
                 # Mark explicitly as not available, so we can spot mptt inconsistencies later.
-                cached_page_urls[current_language][subobject.id] = None
+                cached_page_urls[current_language][subobject_id] = None
                 continue  # TODO: would this cause tree parts nodes to be missed on moving?
 
+            save_language = current_language
+            slug, override_url = translations[current_language][1:3]
+
             # Set URL, using cache for parent URL.
-            if subobject.override_url:
+            if override_url:
                 # Sub object has an explicit URL, the assignment reaffirms this to ensure consistency
-                subobject._cached_url = subobject.override_url
+                new_url = override_url
             else:
                 # Construct the fallback URLs for all fallback languages (typically 1).
                 # Even though a regular URL was found, construct it, in case sub-sub objects need it.
                 fallback_base = None
                 fallback_lang = None
                 for lang in active_choices:
-                    parent_url = cached_page_urls[lang].get(subobject.parent_id)
+                    parent_url = cached_page_urls[lang].get(parent_id)
                     if parent_url is None:
                         # The parent didn't have a fallback for this language, hence the subobjects can't have it either.
                         # There is no base nor URL for the sub object in this language. (be explicit here, to detect KeyError)
-                        cached_page_urls[lang][subobject.id] = None
+                        cached_page_urls[lang][subobject_id] = None
                         use_fallback_base = True
                     else:
                         # There is a translation in this language, construct the fallback URL
-                        cached_page_urls[lang][subobject.id] = "{}{}/".format(
-                            parent_url, subobject.slug
-                        )
-                        if fallback_base is None and subobject.has_translation(lang):
+                        cached_page_urls[lang][subobject_id] = f"{parent_url}{slug}/"
+                        if fallback_base is None and lang in translations:
                             fallback_base = parent_url
                             fallback_lang = lang
 
                 if use_fallback_base:
                     # Generate URLs using the fallback language in all path parts, no exception.
                     base = fallback_base
-                    subobject.set_current_language(fallback_lang)
+                    save_language = fallback_lang
                 else:
                     # Keep appending to the real translated URL
-                    base = cached_page_urls[current_language][subobject.parent_id]
+                    base = cached_page_urls[current_language][parent_id]
 
                 if base is None:
                     # The site doesn't have fallback languages.
@@ -659,38 +803,63 @@ class UrlNode(AbstractUrlNode):
                     raise ParentTranslationDoesNotExist(
                         "Can't generate URL for child #{} in '{}' to connect to parent #{}.\n"
                         "The child languages are: {}".format(
-                            subobject.id,
+                            subobject_id,
                             current_language,
-                            subobject.parent_id,
-                            ",".join(subobject.get_available_languages()),
+                            parent_id,
+                            ",".join(
+                                UrlNode_Translation.objects.filter(
+                                    master_id=subobject_id
+                                ).values_list("language_code", flat=True)
+                            ),
                         )
                     )
 
                     # Alternative:
                     # no base == no URL for sub object. (be explicit here)
-                    # subobject._cached_url = None
+                    # new_url = None
                 else:
-                    subobject._cached_url = f"{base}{subobject.slug}/"
+                    # Like _update_cached_url(), files don't end with a slash.
+                    new_url = f"{base}{translations[save_language][1]}"
+                    if not _is_file_type(ctype_id, file_types):
+                        new_url += "/"
 
             if not use_fallback_base:
-                cached_page_urls[current_language][subobject.id] = subobject._cached_url
+                cached_page_urls[current_language][subobject_id] = new_url
+
+            translation_id, _, _, old_url = translations[save_language]
+            if new_url != old_url:
+                changed.append((subobject_id, save_language, translation_id, new_url))
+
+        # Apply all changes at once, circumventing save() as the URLs are already calculated.
+        UrlNode_Translation.objects.bulk_update(
+            [
+                UrlNode_Translation(id=translation_id, _cached_url=new_url)
+                for subobject_id, language_code, translation_id, new_url in changed
+            ],
+            ["_cached_url"],
+            batch_size=500,
+        )
 
-            # call base class, so this function doesn't recurse
-            # This reads from _translations_cache!
-            sub_translation = subobject.get_translation(subobject.get_current_language())
-            super(UrlNode, subobject).save_translation(sub_translation)
-            subobject._expire_url_caches()
+        # The translations are also cached by django-parler.
+        # Other caches are already expired by the caller.
+        cache.delete_many(
+            [
+                get_translation_cache_key(UrlNode_Translation, subobject_id, language_code)
+                for subobject_id, language_code, translation_id, new_url in changed
+            ]
+        )
+        self._mark_sitemap_changed([subobject_id for subobject_id, _, _, _ in changed])
 
     def _expire_url_caches(self):
         """
         Reset all cache keys related to this model.
         """
-        cachekeys = [
-            # created by urlresolvers._get_pages_of_type()
-            f"fluent_pages.instance_of.{self.__class__.__name__}.{self.parent_site_id}"
-        ]
-        for cachekey in cachekeys:
-            cache.delete(cachekey)
+        # All caches derive their key from these versions,
+        # e.g. the routing table, menus and the app_reverse() results.
+        if self._is_publication_changed():
+            increase_cache_version(self.parent_site_id, (TREE, PUBLICATION))
+        else:
+            increase_cache_version(self.parent_site_id, (TREE,))
 
 
 class UrlNode_Translation(TranslatedFieldsModel):
@@ -948,6 +1117,14 @@ class PageLayout(models.Model):
 
         return get_template(self.template_path)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        increase_cache_version(scopes=(LAYOUT,))
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        increase_cache_version(scopes=(LAYOUT,))
+
     # Django stuff
     def __str__(self):
         return self.title
@@ -957,3 +1134,52 @@ class PageLayout(models.Model):
         ordering = ("title",)
         verbose_name = _("Layout")
         verbose_name_plural = _("Layouts")
+
+
+class PendingUrlRebuild(models.Model):
+    """
+    A queued update of the sub page URLs, used when :ref:`FLUENT_PAGES_DEFER_URL_REBUILD` is enabled.
+    Until the rebuild completes, the sub pages are still resolved by their previous URL.
+
+    .. versionadded:: 3.1
+    """
+
+    node = models.ForeignKey(UrlNode, on_delete=models.CASCADE, related_name="+")
+    language_code = models.CharField(_("language"), max_length=15, db_index=True)
+    old_url = models.CharField(max_length=255)
+    new_url = models.CharField(max_length=255)
+    failed = models.BooleanField(_("failed"), default=False)
+    created = models.DateTimeField(_("created"), default=now)
+
+    def __str__(self):
+        return f"{self.old_url} -> {self.new_url}"
+
+    class Meta:
+        app_label = "fluent_pages"
+        ordering = ("id",)
+        unique_together = (("node", "language_code"),)
+        verbose_name = _("Pending URL rebuild")
+        verbose_name_plural = _("Pending URL rebuilds")
+
+
+class PendingSitemapShard(models.Model):
+    """
+    A sitemap file with changed pages, used when :ref:`FLUENT_PAGES_SITEMAP_DIR` is enabled.
+    The :ref:`generate_sitemaps` command regenerates these files.
+
+    .. versionadded:: 3.1
+    """
+
+    parent_site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="+")
+    shard = models.PositiveIntegerField(_("shard"))
+    created = models.DateTimeField(_("created"), default=now)
+
+    def __str__(self):
+        return f"#{self.parent_site_id}: sitemap-{self.shard}"
+
+    class Meta:
+        app_label = "fluent_pages"
+        ordering = ("id",)
+        unique_together = (("parent_site", "shard"),)
+        verbose_name = _("Pending sitemap file")
+        verbose_name_plural = _("Pending sitemap files")
@@ -0,0 +1,237 @@
+"""
+Checking the consistency of the page tree.
+
+:func:`check_page_tree` reads the tree in ``tree_id, lft`` order, and verifies the MPTT fields,
+the parent and level of each node, and the cached URL of each translation.
+Only the ancestors of the current node are kept in memory, so large trees can be checked
+without locking the tables. :func:`fix_tree_problems` repairs only the affected trees and URLs,
+instead of running a full ``rebuild_page_tree``.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from parler.cache import get_translation_cache_key
+
+from fluent_pages import appsettings
+from fluent_pages.cache import increase_cache_version
+
+__all__ = (
+    "TreeProblem",
+    "check_page_tree",
+    "fix_tree_problems",
+)
+
+#: A problem in the page tree. The ``kind`` is one of ``"parent"``, ``"level"``, ``"lft"``,
+#: ``"rght"`` or ``"url"``. Only the ``"url"`` problems have a ``language_code``.
+TreeProblem = namedtuple(
+    "TreeProblem", ("kind", "tree_id", "node_id", "language_code", "expected", "found")
+)
+
+# The MPTT problems, which require rebuilding the tree.
+STRUCTURE_PROBLEMS = ("parent", "level", "lft", "rght")
+
+
+class _StackEntry:
+    # An ancestor of the current node, with the URL data for its sub nodes.
+    __slots__ = ("id", "rght", "is_file", "translations", "urls")
+
+    def __init__(self, id, rght, is_file, translations):
+        self.id = id
+        self.rght = rght
+        self.is_file = is_file
+        self.translations = translations  # {language_code: (slug, override_url, _cached_url)}
+        self.urls = {}
+
+
+def check_page_tree(site_id=None, language_code=None, tree_ids=None, chunk_size=1000):
+    """
+    Check the page tree, and yield a :class:`TreeProblem` for each inconsistency.
+
+    The check can be limited to a single site, language or a set of trees.
+    Once the MPTT fields of a tree are broken, the URLs of that tree are no longer checked,
+    as the nodes can't be read in the proper order.
+    """
+    from fluent_pages.models.db import UrlNode, UrlNode_Translation
+
+    nodes = UrlNode.objects.all()
+    translations = UrlNode_Translation.objects.all()
+    if site_id is not None:
+        nodes = nodes.filter(parent_site=site_id)
+        translations = translations.filter(master__parent_site=site_id)
+    if tree_ids is not None:
+        nodes = nodes.filter(tree_id__in=tree_ids)
+        translations = translations.filter(master__tree_id__in=tree_ids)
+
+    node_rows = (
+        nodes.order_by("tree_id", "lft", "id")
+        .values_list("id", "parent_id", "tree_id", "lft", "rght", "level", "polymorphic_ctype_id")
+        .iterator(chunk_size=chunk_size)
+    )
+    # All languages are read, the URLs can include slugs of fallback languages.
+    translation_rows = (
+        translations.order_by("master__tree_id", "master__lft", "master_id")
+        .values_list("master_id", "language_code", "slug", "override_url", "_cached_url")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    file_types = {}
+    stack = []
+    tree_id = None
+    broken = False
+    counter = 1
+    next_translation = next(translation_rows, None)
+
+    for id, parent_id, node_tree_id, lft, rght, level, ctype_id in node_rows:
+        if node_tree_id != tree_id:
+            # Close the previous tree, start a new one.
+            yield from _close_nodes(stack, tree_id, counter)
+            stack = []
+            tree_id = node_tree_id
+            broken = False
+            counter = 1
+
+        # Collect the translations of this node, both queries have the same ordering.
+        node_translations = {}
+        while next_translation is not None and next_translation[0] == id:
+            lang, slug, override_url, cached_url = next_translation[1:]
+            node_translations[lang] = (slug, override_url, cached_url)
+            next_translation = next(translation_rows, None)
+
+        # Close the ancestors that end before this node.
+        while stack and stack[-1].rght < lft:
+            entry = stack.pop()
+            if entry.rght != counter:
+                broken = True
+                yield TreeProblem("rght", tree_id, entry.id, None, counter, entry.rght)
+            counter = entry.rght + 1
+
+        expected_parent = stack[-1].id if stack else None
+        problems = []
+        if parent_id != expected_parent:
+            problems.append(TreeProblem("parent", tree_id, id, None, expected_parent, parent_id))
+        if level != len(stack):
+            problems.append(TreeProblem("level", tree_id, id, None, len(stack), level))
+        if lft != counter:
+            problems.append(TreeProblem("lft", tree_id, id, None, counter, lft))
+        if problems:
+            broken = True
+            yield from problems
+        counter = lft + 1
+
+        try:
+            is_file = file_types[ctype_id]
+        except KeyError:
+            from fluent_pages.extensions import page_type_pool
+
+            is_file = file_types[ctype_id] = page_type_pool._get_plugin_by_content_type(
+                ctype_id
+            ).is_file
+
+        entry = _StackEntry(id, rght, is_file, node_translations)
+        stack.append(entry)
+        if not broken:
+            for lang, (slug, override_url, cached_url) in node_translations.items():
+                if language_code is not None and lang != language_code:
+                    continue
+                expected = _get_url(stack, len(stack) - 1, lang)
+                if cached_url != expected:
+                    yield TreeProblem("url", tree_id, id, lang, expected, cached_url)
+
+        if rght <= lft:
+            broken = True
+            yield TreeProblem("rght", tree_id, id, None, lft + 1, rght)
+            stack.pop()
+
+    yield from _close_nodes(stack, tree_id, counter)
+
+
+def _close_nodes(stack, tree_id, counter):
+    # Verify the "rght" values of the nodes that are closed at the end of a tree.
+    while stack:
+        entry = stack.pop()
+        if entry.rght != counter:
+            yield TreeProblem("rght", tree_id, entry.id, None, counter, entry.rght)
+        counter = entry.rght + 1
+
+
+def _get_url(stack, index, language_code):
+    # Like UrlNode._update_cached_url(), generate the URL from the ancestors.
+    # Nodes that are not translated use the slug of a fallback language,
+    # like rebuild_page_tree does.
+    entry = stack[index]
+    try:
+        return entry.urls[language_code]
+    except KeyError:
+        pass
+
+    own = entry.translations.get(language_code)
+    if own is not None and own[1]:
+        url = own[1]
+    else:
+        parent_url = _get_url(stack, index - 1, language_code) if index else "/"
+        if not parent_url.endswith("/"):
+            parent_url += "/"
+
+        url = parent_url
+        for lang in appsettings.FLUENT_PAGES_LANGUAGES.get_active_choices(language_code):
+            if lang in entry.translations:
+                url = f"{parent_url}{entry.translations[lang][0]}"
+                if not entry.is_file:
+                    url += "/"
+                break
+
+    entry.urls[language_code] = url
+    return url
+
+
+@transaction.atomic
+def fix_tree_problems(problems, site_id=None):
+    """
+    Repair the problems that :func:`check_page_tree` found.
+    The trees with broken MPTT fields are rebuilt and checked again, and the URLs are corrected.
+    Returns the URL problems that were fixed.
+    """
+    from fluent_pages.models.db import UrlNode, UrlNode_Translation
+
+    problems = list(problems)
+    broken_trees = {problem.tree_id for problem in problems if problem.kind in STRUCTURE_PROBLEMS}
+    url_problems = [problem for problem in problems if problem.kind == "url"]
+    if broken_trees:
+        for tree_id in sorted(broken_trees):
+            UrlNode._tree_manager.partial_rebuild(tree_id)
+
+        # The node order of the tree could have changed, check the URLs again.
+        url_problems = [problem for problem in url_problems if problem.tree_id not in broken_trees]
+        url_problems += [
+            problem
+            for problem in check_page_tree(site_id=site_id, tree_ids=broken_trees)
+            if problem.kind == "url"
+        ]
+
+    if url_problems:
+        expected = {(p.node_id, p.language_code): p.expected for p in url_problems}
+        rows = UrlNode_Translation.objects.filter(
+            master__in={p.node_id for p in url_problems}
+        ).values_list("id", "master_id", "language_code")
+
+        objs = []
+        for id, master_id, lang in rows:
+            url = expected.get((master_id, lang))
+            if url is not None:
+                objs.append(UrlNode_Translation(id=id, _cached_url=url))
+        UrlNode_Translation.objects.bulk_update(objs, ["_cached_url"], batch_size=500)
+
+        # The translations are updated without their save() method,
+        # remove the objects that django-parler cached.
+        cache.delete_many(
+            [
+                get_translation_cache_key(UrlNode_Translation, node_id, lang)
+                for node_id, lang in expected
+            ]
+        )
+
+    if broken_trees or url_problems:
+        increase_cache_version(site_id)
+
+    return url_problems
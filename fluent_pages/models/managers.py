@@ -2,6 +2,7 @@
 The manager class for the CMS models
 """
 from django.conf import settings
+from django.db.models import Min
 from django.db.models.query_utils import Q
 from django.utils.timezone import now
 from django.utils.translation import get_language
@@ -11,6 +12,9 @@ from polymorphic_tree.managers import PolymorphicMPTTModelManager, PolymorphicMP
 
 from fluent_pages import appsettings
 
+from .bulk import bulk_create_tree
+from .rebuild import get_pending_url
+from .routing import get_routing_table
 from .utils import DecoratingQuerySet
 
 
@@ -22,10 +26,12 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._parent_site = None
+        self._url_pattern_types_only = False
 
     def _clone(self):
         c = super()._clone()
         c._parent_site = self._parent_site
+        c._url_pattern_types_only = self._url_pattern_types_only
         return c
 
     def active_translations(self, language_code=None, **translated_fields):
@@ -50,16 +56,47 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
         Raises UrlNode.DoesNotExist when the item is not found.
 
         .. versionchanged:: 0.9 This filter only returns the pages of the current site.
+        .. versionchanged:: 3.1 Sub pages of a page with a pending URL rebuild are found by their new URL.
         """
         if language_code is None:
             language_code = self._language or get_language()
 
-        # Don't normalize slashes, expect the URLs to be sane.
         try:
-            obj = self._single_site().get(
+            return self._get_for_path(path, language_code)
+        except self.model.DoesNotExist:
+            if not appsettings.FLUENT_PAGES_DEFER_URL_REBUILD:
+                raise
+
+            # The sub pages still have their previous URL in the database.
+            site_id = self._single_site()._get_parent_site_id()
+            old_path = get_pending_url(path, language_code, site_id)
+            if old_path is None:
+                raise
+
+            obj = self._get_for_path(old_path, language_code)
+            obj._cached_url = path  # only in memory, until the rebuild is completed.
+            return obj
+
+    def _get_for_path(self, path, language_code):
+        # Don't normalize slashes, expect the URLs to be sane.
+        qs = self._single_site()
+        site_id = qs._get_parent_site_id()
+        if appsettings.FLUENT_PAGES_ROUTING_TABLE and site_id is not None:
+            # Find the node in memory, only fetch it by primary key.
+            route = get_routing_table(site_id).get(path, language_code)
+            if route is None:
+                raise self.model.DoesNotExist(
+                    f"No published {self.model.__name__} found for the path '{path}'"
+                )
+            qs = qs.filter(pk=route.node_id)
+        else:
+            qs = qs.filter(
                 translations___cached_url=path,
                 translations__language_code=language_code,
             )
+
+        try:
+            obj = qs.get()
             obj.set_current_language(
                 language_code
             )  # NOTE. Explicitly set language to the state the object was fetched in.
@@ -80,13 +117,25 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
         if language_code is None:
             language_code = self._language or get_language()
 
+        qs = self._single_site()
+        site_id = qs._get_parent_site_id()
+        if (
+            appsettings.FLUENT_PAGES_ROUTING_TABLE
+            and site_id is not None
+            and self._url_pattern_types_only
+        ):
+            return qs._best_match_for_routes(
+                get_routing_table(site_id).get_best_matches(path, language_code),
+                path,
+                language_code,
+            )
+
         # Based on FeinCMS:
         paths = self._split_path_levels(path)
 
         try:
             qs = (
-                self._single_site()
-                .filter(
+                qs.filter(
                     translations___cached_url__in=paths,
                     translations__language_code=language_code,
                 )
@@ -103,6 +152,34 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
                 f"No published {self.model.__name__} found for the path '{path}'"
             )
 
+    def _best_match_for_routes(self, matches, path, language_code):
+        """
+        Fetch the best match for :func:`best_match_for_path` using the prefix matches of the routing table.
+        """
+        if not matches:
+            # Not placed below any page with URL patterns, no need to query.
+            raise self.model.DoesNotExist(
+                f"No published {self.model.__name__} found for the path '{path}'"
+            )
+
+        url_lengths = {route.node_id: len(url) for url, route in matches}
+        if len(matches) == 1:
+            candidates = list(self.filter(pk=matches[0][1].node_id))
+        else:
+            candidates = list(self.filter(pk__in=url_lengths.keys()))
+
+        if not candidates:
+            raise self.model.DoesNotExist(
+                f"No published {self.model.__name__} found for the path '{path}'"
+            )
+
+        # Same ordering as best_match_for_path() uses in SQL.
+        obj = max(candidates, key=lambda node: (node.level, url_lengths[node.pk]))
+        obj.set_current_language(
+            language_code
+        )  # NOTE: Explicitly set language to the state the object was fetched in.
+        return obj
+
     def _split_path_levels(self, path):
         """
         Split the URL path, used by best_match_for_path()
@@ -155,6 +232,12 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
         self._parent_site = site
         return self.filter(parent_site=site)
 
+    def _get_parent_site_id(self):
+        """
+        Return the ID of the site this queryset is filtered on, if any.
+        """
+        return getattr(self._parent_site, "pk", self._parent_site)
+
     def _single_site(self):
         """
         Make sure the queryset is filtered on a parent site, if that didn't happen already.
@@ -184,6 +267,31 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
             .filter(Q(publication_end_date__isnull=True) | Q(publication_end_date__gte=now()))
         )
 
+    def next_publication_change(self, date=None):
+        """
+        Return the first moment after ``date`` at which a page is published or unpublished
+        because of its publication date or publication end date.
+        Returns ``None`` when there are no scheduled changes.
+
+        .. versionadded:: 3.1
+        """
+        from fluent_pages.models import UrlNode
+
+        if date is None:
+            date = now()
+
+        # Matches the comparisons of published().
+        result = (
+            self._single_site()
+            .filter(status=UrlNode.PUBLISHED)
+            .aggregate(
+                next_start=Min("publication_date", filter=Q(publication_date__gte=date)),
+                next_end=Min("publication_end_date", filter=Q(publication_end_date__gte=date)),
+            )
+        )
+        changes = [value for value in result.values() if value is not None]
+        return min(changes) if changes else None
+
     def in_navigation(self, for_user=None):
         """
         Return only pages in the navigation.
@@ -203,7 +311,9 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
         """
         from fluent_pages.extensions import page_type_pool
 
-        return self.filter(polymorphic_ctype_id__in=(page_type_pool.get_url_pattern_types()))
+        qs = self.filter(polymorphic_ctype_id__in=(page_type_pool.get_url_pattern_types()))
+        qs._url_pattern_types_only = True  # allows best_match_for_path() to use the routing table.
+        return qs
 
     def toplevel(self):
         """
@@ -211,6 +321,16 @@ class UrlNodeQuerySet(TranslatableQuerySet, DecoratingQuerySet, PolymorphicMPTTQ
         """
         return self.filter(parent__isnull=True, level=0)
 
+    def with_all_urls(self):
+        """
+        .. versionadded:: 3.1
+        Fetch the URLs of all languages at once, so :func:`~fluent_pages.models.UrlNode.get_absolute_urls`
+        and the ``str()`` value of a :class:`~fluent_pages.models.UrlNode` don't run a query per node.
+        This only applies to querysets that use it; the admin delete confirmation page
+        fetches the sub pages with Django's deletion collector, which still runs a query per node.
+        """
+        return self.prefetch_related("translations")
+
     def _mark_current(self, current_page):
         """
         Internal API to mark the given page as "is_current" in the resulting set.
@@ -280,6 +400,13 @@ class UrlNodeManager(PolymorphicMPTTModelManager, TranslatableManager):
         """
         return self.all().published(for_user=for_user)
 
+    def next_publication_change(self, date=None):
+        """
+        .. versionadded:: 3.1
+        Return the first moment at which a page is published or unpublished by its publication dates.
+        """
+        return self.all().next_publication_change(date=date)
+
     def in_navigation(self, for_user=None):
         """
         Return only pages in the navigation.
@@ -299,6 +426,13 @@ class UrlNodeManager(PolymorphicMPTTModelManager, TranslatableManager):
         """
         return self.all().toplevel()
 
+    def with_all_urls(self):
+        """
+        .. versionadded:: 3.1
+        Fetch the URLs of all languages at once, see :func:`UrlNodeQuerySet.with_all_urls`.
+        """
+        return self.all().with_all_urls()
+
     def toplevel_navigation(self, current_page=None, for_user=None, language_code=None):
         """
         Return all toplevel items, ordered by menu ordering.
@@ -338,3 +472,10 @@ class UrlNodeManager(PolymorphicMPTTModelManager, TranslatableManager):
         Return only page types which have a custom URLpattern attached.
         """
         return self.all().url_pattern_types()
+
+    def bulk_create_tree(self, tree, parent=None, batch_size=500):
+        """
+        .. versionadded:: 3.1
+        Create a tree of new pages with a few bulk inserts, see :func:`fluent_pages.models.bulk.bulk_create_tree`.
+        """
+        return bulk_create_tree(tree, parent=parent, batch_size=batch_size)
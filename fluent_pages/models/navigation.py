@@ -9,8 +9,17 @@ It offers properties such as :attr:`~fluent_pages.models.Page.parent`
 and :attr:`~fluent_pages.models.Page.children` (a :class:`~django.db.models.RelatedManager`),
 and methods such as `get_parent()` and `get_children()` through the `MPTTModel` base class.
 """
+from collections import namedtuple
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import get_script_prefix, get_urlconf
+from django.utils.translation import get_language
 from parler.models import TranslationDoesNotExist
 
+from fluent_pages.cache import PUBLICATION, TREE, get_cache_version, get_publication_timeout
+
 
 class NavigationNode:
     """
@@ -91,9 +100,20 @@ class PageNavigationNode(NavigationNode):
     An implementation of the :class:`NavigationNode` for :class:`~fluent_pages.models.Page` models.
     """
 
-    def __init__(self, page, parent_node=None, max_depth=9999, current_page=None, for_user=None):
+    def __init__(
+        self,
+        page,
+        parent_node=None,
+        max_depth=9999,
+        current_page=None,
+        for_user=None,
+        prefetched_children=None,
+    ):
         """
         Initialize the node with a Page.
+
+        The ``prefetched_children`` can be provided by :func:`prefetch_navigation_children`,
+        to avoid a query for each node that has children.
         """
         assert page.in_navigation, (
             "PageNavigationNode can't take page #%d (%s) which is not visible in the navigation."
@@ -106,6 +126,7 @@ class PageNavigationNode(NavigationNode):
         self._children = None
         self._max_depth = max_depth
         self._user = for_user
+        self._prefetched_children = prefetched_children
 
         # Depths starts relative to the first level.
         if not parent_node:
@@ -172,6 +193,7 @@ class PageNavigationNode(NavigationNode):
                     parent_node=self,
                     max_depth=self._max_depth,
                     current_page=self._current_page,
+                    prefetched_children=self._prefetched_children,
                 )
 
     @property
@@ -182,6 +204,10 @@ class PageNavigationNode(NavigationNode):
     def _read_children(self):
         if self._children is None and not self._page.is_leaf_node():
             if (self._page.get_level() + 1) < self._max_depth:  # level 0 = toplevel.
+                if self._prefetched_children is not None:
+                    self._children = self._prefetched_children.get(self._page.pk, [])
+                    return
+
                 # children = self._page.get_children()  # Via MPTT
                 self._children = self._page.children.in_navigation(
                     for_user=self._user
@@ -207,3 +233,268 @@ class PageNavigationNode(NavigationNode):
         .. versionadded:: 0.9 Provide access to the underlying page object, if it exists.
         """
         return self._page
+
+
+def prefetch_navigation_children(pages, max_depth=9999, current_page=None, for_user=None):
+    """
+    Fetch all navigation items below the given pages at once.
+    This uses the MPTT fields to read the subtrees up to ``max_depth`` in a single query,
+    and prefetches their translations in a second one.
+
+    The result can be passed as ``prefetched_children`` argument to the :class:`PageNavigationNode`.
+    It returns a dictionary with a list of child pages for each parent ID.
+
+    .. versionadded:: 3.1
+    """
+    from django.db.models import Q
+
+    from fluent_pages.models.db import UrlNode
+
+    pages = list(pages)
+    if not pages:
+        return {}
+
+    # Group the subtree ranges per tree, as siblings share the same tree.
+    ranges = {}
+    for page in pages:
+        if page.is_leaf_node():
+            continue
+        lft, rght, max_level = ranges.get(page.tree_id, (page.lft, page.rght, 0))
+        ranges[page.tree_id] = (
+            min(lft, page.lft),
+            max(rght, page.rght),
+            max(max_level, page.level + max_depth),  # same limit as PageNavigationNode uses
+        )
+
+    if not ranges:
+        return {}
+
+    subtrees = Q()
+    for tree_id, (lft, rght, max_level) in ranges.items():
+        subtrees |= Q(tree_id=tree_id, lft__gt=lft, rght__lt=rght, level__lt=max_level)
+
+    qs = UrlNode.objects.in_navigation(for_user=for_user).filter(subtrees)
+    if any(page.get_real_instance_class() is not page.__class__ for page in pages):
+        # If the parent wasn't polymorphic, neither will it's children be.
+        qs = qs.non_polymorphic()
+
+    # Assemble the tree, only including nodes that can be reached from the given pages.
+    # The queryset is ordered by tree_id, lft so parents are always seen before their children.
+    children = {}
+    reachable = {page.pk for page in pages}
+    current_id = current_page.pk if current_page is not None else None
+    for child in qs.prefetch_related("translations"):
+        if child.parent_id in reachable:
+            child.is_current = child.pk == current_id
+            children.setdefault(child.parent_id, []).append(child)
+            reachable.add(child.pk)
+
+    return children
+
+
+#: The data of a single menu item in the :class:`CachedNavigationTree`.
+NavigationItem = namedtuple(
+    "NavigationItem",
+    (
+        "id",
+        "parent_id",
+        "tree_id",
+        "level",
+        "slug",
+        "title",
+        "url",
+        "is_published",
+        "is_draft",
+        "is_leaf",
+    ),
+)
+
+
+class CachedNavigationTree:
+    """
+    A compact copy of the menu pages, which is stored in the cache.
+
+    This only holds the plain values of the pages, so a menu can be rendered without any queries.
+    Use :func:`get_cached_navigation_tree` to retrieve it.
+
+    .. versionadded:: 3.1
+    """
+
+    def __init__(self, items):
+        # The items are ordered by tree_id, lft, so they can be stored in the menu ordering.
+        self.items = {}
+        self.top_ids = []
+        self.children = {}
+        for item in items:
+            self.items[item.id] = item
+            if item.parent_id in self.items:
+                self.children.setdefault(item.parent_id, []).append(item.id)
+            else:
+                self.top_ids.append(item.id)
+
+    def __len__(self):
+        return len(self.items)
+
+    def get_nodes(self, max_depth=9999, current_page=None):
+        """
+        Return the :class:`CachedNavigationNode` objects of the toplevel menu.
+        """
+        return [
+            CachedNavigationNode(
+                self, self.items[item_id], max_depth=max_depth, current_page=current_page
+            )
+            for item_id in self.top_ids
+        ]
+
+
+class CachedNavigationNode(NavigationNode):
+    """
+    An implementation of the :class:`NavigationNode` for the items of a :class:`CachedNavigationTree`.
+    Only the active state is determined for each request, the remaining data comes from the cache.
+    These nodes don't offer the :attr:`page` object.
+
+    .. versionadded:: 3.1
+    """
+
+    def __init__(self, tree, item, parent_node=None, max_depth=9999, current_page=None):
+        super(NavigationNode, self).__init__()
+        self._tree = tree
+        self._item = item
+        self._parent_node = parent_node
+        self._max_depth = max_depth
+        self._current_page = current_page
+
+        # Depths starts relative to the first level.
+        if not parent_node:
+            self._max_depth += item.level
+
+    slug = property(lambda self: self._item.slug)
+    title = property(lambda self: self._item.title)
+    url = property(lambda self: self._item.url)
+    level = property(lambda self: self._item.level)
+    is_published = property(lambda self: self._item.is_published)
+    is_draft = property(lambda self: self._item.is_draft)
+
+    @property
+    def is_active(self):
+        return self._current_page is not None and self._item.id == self._current_page.pk
+
+    @property
+    def is_child_active(self):
+        return (
+            self._current_page is not None
+            and self._item.tree_id == self._current_page.tree_id
+            and self._item.level < self._current_page.level
+        )
+
+    @property
+    def parent(self):
+        if not self._parent_node and self._item.parent_id in self._tree.items:
+            self._parent_node = CachedNavigationNode(
+                self._tree,
+                self._tree.items[self._item.parent_id],
+                max_depth=self._max_depth,
+                current_page=self._current_page,
+            )
+        return self._parent_node
+
+    @property
+    def children(self):
+        if (self._item.level + 1) < self._max_depth:  # level 0 = toplevel.
+            for child_id in self._tree.children.get(self._item.id, ()):
+                yield CachedNavigationNode(
+                    self._tree,
+                    self._tree.items[child_id],
+                    parent_node=self,
+                    max_depth=self._max_depth,
+                    current_page=self._current_page,
+                )
+
+    @property
+    def has_children(self):
+        # Same as PageNavigationNode, this also includes children that are hidden from the menu.
+        return not self._item.is_leaf
+
+    @property
+    def _mptt_meta(self):
+        # Needed for mptt recursetree, which only reads the attribute names.
+        from fluent_pages.models.db import UrlNode
+
+        return UrlNode._mptt_meta
+
+
+def get_cached_navigation_tree(for_user=None, language_code=None, max_depth=9999):
+    """
+    Return the :class:`CachedNavigationTree` of the current site.
+
+    The tree is shared by all anonymous visitors, and a separate tree exists for staff members
+    as they can see draft pages. It only contains the pages up to ``max_depth``, so large sites
+    don't exceed the size limit of the cache. The tree is rebuilt when the page tree changed,
+    or when a page is (un)published by its publication dates.
+
+    .. versionadded:: 3.1
+    """
+    site_id = settings.SITE_ID
+    language_code = language_code or get_language()
+    audience = "staff" if for_user is not None and for_user.is_staff else "public"
+
+    # The page URLs include the root of the pages, which can differ per request.
+    cachekey = "fluent_pages.navigation.{}.{}.{}.{}.{}".format(
+        site_id,
+        language_code,
+        audience,
+        max_depth,
+        _get_url_key(),
+    )
+    version = get_cache_version(site_id, (TREE, PUBLICATION))
+    value = cache.get(cachekey)
+    if value is None or value[0] != version:
+        tree = _build_navigation_tree(for_user, language_code, max_depth)
+        value = (version, tree)
+        cache.set(cachekey, value, get_publication_timeout(site_id))
+
+    return value[1]
+
+
+def _get_url_key():
+    # A cache-safe identifier of the URLconf and script prefix.
+    urlconf = get_urlconf() or settings.ROOT_URLCONF
+    if not isinstance(urlconf, str):
+        urlconf = getattr(urlconf, "__name__", repr(urlconf))
+    return md5(f"{urlconf}:{get_script_prefix()}".encode("utf-8")).hexdigest()
+
+
+def _build_navigation_tree(for_user, language_code, max_depth):
+    from django.utils import translation
+
+    from fluent_pages.models.db import UrlNode
+
+    # Titles and URLs are read in the active language.
+    with translation.override(language_code):
+        top_pages = list(
+            UrlNode.objects.toplevel_navigation(for_user=for_user, language_code=language_code)
+            .prefetch_related("translations")
+        )
+        children = prefetch_navigation_children(top_pages, max_depth=max_depth, for_user=for_user)
+
+        items = []
+        stack = list(reversed(top_pages))
+        while stack:
+            page = stack.pop()
+            items.append(
+                NavigationItem(
+                    id=page.pk,
+                    parent_id=page.parent_id,
+                    tree_id=page.tree_id,
+                    level=page.level,
+                    slug=page.slug,
+                    title=page.title,
+                    url=page.url,
+                    is_published=page.is_published,
+                    is_draft=page.is_draft,
+                    is_leaf=page.is_leaf_node(),
+                )
+            )
+            stack.extend(reversed(children.get(page.pk, ())))
+
+    return CachedNavigationTree(items)
@@ -0,0 +1,162 @@
+"""
+Deferred rebuilding of the sub page URLs.
+
+When :ref:`FLUENT_PAGES_DEFER_URL_REBUILD` is enabled, changing the URL of a page
+only saves the page itself. Updating the URLs of all sub pages is queued in the database,
+and processed in a background thread or by the ``process_url_rebuilds`` management command.
+
+Until that happens, :func:`UrlNode.objects.get_for_path() <fluent_pages.models.UrlNodeQuerySet.get_for_path>`
+translates the new URL of a sub page to the previous URL that is still stored in the database.
+When a rebuild fails, it stays in the queue (marked as failed) until ``rebuild_page_tree`` runs,
+so the sub pages can still be found by their new URL.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from fluent_pages import appsettings
+from fluent_pages.cache import get_tree_version, is_cache_shared
+
+__all__ = (
+    "queue_url_rebuild",
+    "process_url_rebuilds",
+    "get_pending_url",
+)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def queue_url_rebuild(node, translation, old_url):
+    """
+    Queue the update of the sub page URLs, after the URL of the translation changed.
+    """
+    from fluent_pages.models.db import PendingUrlRebuild
+
+    # When the node was already waiting for a rebuild, the sub pages still have the oldest URL.
+    rebuild, created = PendingUrlRebuild.objects.get_or_create(
+        node=node,
+        language_code=translation.language_code,
+        defaults={"old_url": old_url, "new_url": translation._cached_url},
+    )
+    if not created:
+        # Also retry a failed rebuild.
+        rebuild.new_url = translation._cached_url
+        rebuild.failed = False
+        rebuild.save(update_fields=("new_url", "failed"))
+
+    if appsettings.FLUENT_PAGES_DEFER_URL_REBUILD == "thread":
+        transaction.on_commit(_start_thread)
+
+
+def process_url_rebuilds(limit=None):
+    """
+    Update the sub page URLs of all queued rebuilds.
+    Returns the number of processed rebuilds.
+    """
+    from fluent_pages.models.db import PendingUrlRebuild, UrlNode, UrlNode_Translation
+
+    count = 0
+    while limit is None or count < limit:
+        rebuild = PendingUrlRebuild.objects.filter(failed=False).first()
+        if rebuild is None:
+            break
+
+        failed = False
+        with transaction.atomic():
+            try:
+                node = UrlNode.objects.non_polymorphic().get(pk=rebuild.node_id)
+                translation = node.translations.get(language_code=rebuild.language_code)
+            except (UrlNode.DoesNotExist, UrlNode_Translation.DoesNotExist):
+                pass
+            else:
+                try:
+                    # A savepoint, so the transaction can continue after a database error.
+                    with transaction.atomic():
+                        node._update_decendant_urls(translation)
+                except Exception:
+                    logger.exception(
+                        "Failed to update the sub page URLs of %s, "
+                        "consider running 'manage.py rebuild_page_tree'",
+                        rebuild.new_url,
+                    )
+                    failed = True
+                node._expire_url_caches()
+
+            # When the URL changed again in the meantime, the rebuild is still pending.
+            # A failed rebuild is kept, so the sub pages are still found by their new URL.
+            pending = PendingUrlRebuild.objects.filter(pk=rebuild.pk, new_url=rebuild.new_url)
+            if failed:
+                pending.update(failed=True)
+            else:
+                pending.delete()
+
+        count += 1
+
+    return count
+
+
+def get_pending_url(path, language_code, site_id=None):
+    """
+    Return the URL a path had before a pending rebuild, or ``None`` when it's not affected.
+    """
+    from fluent_pages.models.db import PendingUrlRebuild
+
+    if not _has_pending_rebuilds(site_id):
+        return None
+
+    rebuilds = PendingUrlRebuild.objects.filter(language_code=language_code)
+    if site_id is not None:
+        rebuilds = rebuilds.filter(node__parent_site=site_id)
+
+    # Find the closest parent page that has a new URL.
+    best = None
+    for old_url, new_url in rebuilds.values_list("old_url", "new_url"):
+        if path.startswith(new_url) and path != new_url:
+            if best is None or len(new_url) > len(best[1]):
+                best = (old_url, new_url)
+
+    if best is None:
+        return None
+    return best[0] + path[len(best[1]) :]
+
+
+def _has_pending_rebuilds(site_id):
+    # Avoid a query for every 404 when the queue is empty. Queueing and completing a rebuild
+    # both increase the tree version, so the cached answer can be trusted until then.
+    # With a per-process cache, the other processes wouldn't notice, so always check.
+    from fluent_pages.models.db import PendingUrlRebuild
+
+    if site_id is None or not is_cache_shared():
+        return True
+
+    cachekey = f"fluent_pages.pending_url_rebuilds.{site_id}"
+    version = get_tree_version(site_id)
+    value = cache.get(cachekey)
+    if value is None or value[0] != version:
+        pending = PendingUrlRebuild.objects.filter(node__parent_site=site_id).exists()
+        value = (version, pending)
+        cache.set(cachekey, value, None)
+
+    return value[1]
+
+
+def _start_thread():
+    global _executor
+    if _executor is None:
+        # A single worker, so the rebuilds are processed in order.
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fluent_pages")
+    _executor.submit(_process_in_thread)
+
+
+def _process_in_thread():
+    try:
+        process_url_rebuilds()
+    except Exception:
+        logger.exception("Failed to process the pending URL rebuilds")
+    finally:
+        # The thread has its own database connection.
+        connection.close()
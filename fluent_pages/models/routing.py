@@ -0,0 +1,140 @@
+"""
+The in-process routing table, which maps URL paths to page nodes.
+
+When :ref:`FLUENT_PAGES_ROUTING_TABLE` is enabled,
+:func:`UrlNode.objects.get_for_path() <fluent_pages.models.UrlNodeQuerySet.get_for_path>`
+consults this table before running any query.
+Resolving a page then costs a single primary key lookup, and unknown paths don't need a query at all.
+
+Each process loads the table once per site, and reloads it when the tree version of the site changed.
+"""
+from collections import namedtuple
+from threading import Lock
+
+from fluent_pages.cache import get_tree_version
+
+__all__ = (
+    "Route",
+    "RoutingTable",
+    "get_routing_table",
+)
+
+#: The location of a path in the page tree.
+Route = namedtuple("Route", ("node_id", "ctype_id"))
+
+_tables = {}
+_load_lock = Lock()
+
+
+class _TrieNode:
+    # A node in the prefix-trie, each level represents a path segment.
+    # The route for a URL that ends with a slash is stored in the child named "".
+    __slots__ = ("children", "url", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.url = None
+        self.route = None
+
+
+class RoutingTable:
+    """
+    The mapping of ``(language_code, _cached_url)`` to a :class:`Route` for a single site.
+    """
+
+    def __init__(self, site_id, version):
+        self.site_id = site_id
+        self.version = version
+        self._routes = {}
+        self._url_pattern_tries = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: site #{self.site_id}, version {self.version}>"
+
+    def load(self):
+        """
+        Read all URLs of the site in a single query.
+        """
+        from fluent_pages.models.db import UrlNode_Translation
+
+        rows = UrlNode_Translation.objects.filter(
+            master__parent_site=self.site_id, _cached_url__isnull=False
+        ).values_list("language_code", "_cached_url", "master_id", "master__polymorphic_ctype_id")
+
+        routes = {}
+        for language_code, cached_url, node_id, ctype_id in rows.iterator():
+            routes.setdefault(language_code, {})[cached_url] = Route(node_id, ctype_id)
+
+        self._routes = routes
+        self._url_pattern_tries = {}
+
+    def get(self, path, language_code):
+        """
+        Return the :class:`Route` for the path, or ``None`` when there is no such page.
+        """
+        return self._routes.get(language_code, {}).get(path)
+
+    def get_best_matches(self, path, language_code):
+        """
+        Return the routes of the pages with URL patterns (e.g. a blog or shop) that the path is located in.
+        The result is a list of ``(url, route)`` tuples, the longest URL first.
+        Like :func:`~fluent_pages.models.UrlNodeQuerySet.best_match_for_path`, the path itself is also included.
+        """
+        trie = self._url_pattern_tries.get(language_code)
+        if trie is None:
+            trie = self._build_url_pattern_trie(language_code)
+            self._url_pattern_tries[language_code] = trie
+
+        matches = []
+        node = trie
+        tokens = path[1:].split("/")
+        for token in tokens:
+            # Parent URLs end with a slash, so they're found in the "" child.
+            folder = node.children.get("")
+            if folder is not None and folder.route is not None:
+                matches.append((folder.url, folder.route))
+
+            node = node.children.get(token)
+            if node is None:
+                break
+        else:
+            if tokens[-1] and node.route is not None:
+                matches.append((node.url, node.route))
+
+        matches.reverse()
+        return matches
+
+    def _build_url_pattern_trie(self, language_code):
+        from fluent_pages.extensions import page_type_pool
+
+        url_types = set(page_type_pool.get_url_pattern_types())
+        root = _TrieNode()
+        for url, route in self._routes.get(language_code, {}).items():
+            if route.ctype_id not in url_types or not url.startswith("/"):
+                continue
+
+            node = root
+            for token in url[1:].split("/"):
+                node = node.children.setdefault(token, _TrieNode())
+            node.url = url
+            node.route = route
+
+        return root
+
+
+def get_routing_table(site_id):
+    """
+    Return the routing table for the site, (re)loading it when the page tree changed.
+    """
+    version = get_tree_version(site_id)
+    table = _tables.get(site_id)
+    if table is None or table.version != version:
+        # Make sure there is only one thread loading the table.
+        with _load_lock:
+            table = _tables.get(site_id)
+            if table is None or table.version != version:
+                table = RoutingTable(site_id, version)
+                table.load()
+                _tables[site_id] = table
+
+    return table
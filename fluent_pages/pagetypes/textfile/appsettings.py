@@ -0,0 +1,4 @@
+from django.conf import settings
+
+# The number of seconds the file contents are cached, None disables the cache.
+FLUENT_TEXTFILE_CACHE_TIMEOUT = getattr(settings, "FLUENT_TEXTFILE_CACHE_TIMEOUT", None)
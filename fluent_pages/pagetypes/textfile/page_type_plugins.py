@@ -2,6 +2,7 @@ from django.http import HttpResponse
 
 from fluent_pages.extensions import PageTypePlugin, page_type_pool
 
+from . import appsettings
 from .models import TextFile
 
 
@@ -11,6 +12,11 @@ class TextFilePlugin(PageTypePlugin):
     is_file = True
     default_in_sitemaps = False
 
+    @property
+    def cache_timeout(self):
+        # Output only changes when the page is saved, but caching is opt-in.
+        return appsettings.FLUENT_TEXTFILE_CACHE_TIMEOUT
+
     def get_response(self, request, textfile, **kwargs):
         content_type = textfile.content_type
         if content_type in TextFile.UTF8_TYPES:
@@ -1,4 +1,9 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+
 from fluent_pages.models import UrlNodeManager, UrlNodeQuerySet
+from fluent_pages.pagetypes.textfile import appsettings
 from fluent_pages.pagetypes.textfile.models import TextFile
 from fluent_pages.tests.utils import AppTestCase
 
@@ -10,3 +15,49 @@ class TextFileTests(AppTestCase):
         """
         self.assertIsInstance(TextFile._default_manager, UrlNodeManager)
         self.assertIsInstance(TextFile.objects.all(), UrlNodeQuerySet)
+
+    def test_uncached_response(self):
+        """
+        Test that the output is not cached by default.
+        """
+        cache.clear()
+        textfile = TextFile.objects.create(
+            slug="robots",
+            status=TextFile.PUBLISHED,
+            author=self.user,
+            content="User-agent: *",
+        )
+
+        self.assertEqual(self.client.get("/robots")["Content-Type"], "text/plain")
+        TextFile.objects.filter(pk=textfile.pk).update(content_type="text/xml")
+        self.assertEqual(self.client.get("/robots")["Content-Type"], "text/xml; charset=utf-8")
+
+    @patch.object(appsettings, "FLUENT_TEXTFILE_CACHE_TIMEOUT", 3600)
+    def test_cached_response(self):
+        """
+        Test that the output is cached until the file is saved, when this is enabled.
+        """
+        cache.clear()
+        textfile = TextFile.objects.create(
+            slug="robots",
+            status=TextFile.PUBLISHED,
+            author=self.user,
+            content="User-agent: *",
+        )
+
+        response = self.client.get("/robots")
+        self.assertEqual(response.content, b"User-agent: *")
+        # The session middleware still sees that the user was checked.
+        self.assertIn("Cookie", response["Vary"])
+        with self.assertNumQueries(2):  # only the page lookup, no rendering.
+            response = self.client.get("/robots")
+        self.assertEqual(response.content, b"User-agent: *")
+        self.assertEqual(response["Content-Type"], "text/plain")
+
+        # Changes that bypass save() are not seen until the cache expires.
+        TextFile.objects.filter(pk=textfile.pk).update(content_type="text/xml")
+        self.assertEqual(self.client.get("/robots")["Content-Type"], "text/plain")
+
+        textfile.content = "User-agent: foo"
+        textfile.save()
+        self.assertEqual(self.client.get("/robots").content, b"User-agent: foo")
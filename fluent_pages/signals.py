@@ -0,0 +1,13 @@
+"""
+Signals sent by fluent_pages.
+"""
+from django.dispatch import Signal
+
+__all__ = ("cache_version_changed",)
+
+#: .. versionadded:: 3.1
+#: Sent when the cache version of a site increased, see :mod:`fluent_pages.cache`.
+#: The receivers get the ``site_id`` and the ``scopes`` that changed.
+#: This can be sent inside a transaction, use :func:`~django.db.transaction.on_commit`
+#: when the caches are rebuilt directly.
+cache_version_changed = Signal()
@@ -13,35 +13,383 @@ This can be done using:
     urlpatterns += [
         url(r'^sitemap.xml$', 'django.contrib.sitemaps.views.sitemap', {'sitemaps': sitemaps}),
     ]
+
+To add the ``hreflang`` links of the translations, use a subclass that sets
+:attr:`PageSitemap.alternates <fluent_pages.sitemaps.PageSitemap.alternates>` to ``True``.
+This requires Django 3.2 or newer.
+
+For large sites, the sitemap can also be written to static files using :func:`generate_sitemap_files`.
+The pages are divided in shards by their ID, so only the shards with changed pages are regenerated.
 """
+import gzip
+import os
+from collections import namedtuple
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import django
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sites.models import Site
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Max, Q
+from django.utils import translation
+from django.utils.timezone import now
 
-from fluent_pages.models import UrlNode
+from fluent_pages import appsettings
+from fluent_pages.models import UrlNode, UrlNode_Translation
+from fluent_pages.models.db import PendingSitemapShard
+from fluent_pages.urlresolvers import _get_url_root
+
+#: A single page in the sitemap.
+SitemapItem = namedtuple("SitemapItem", ("id", "language_code", "url", "lastmod"))
+
+#: The range of page IDs in a single sitemap file, which also limits it to 50.000 URLs.
+SHARD_SIZE = 50000
+
+
+class SitemapItems:
+    """
+    A lazy sequence of :class:`SitemapItem` objects, which reads the pages in chunks.
+    Only the fields for the sitemap are fetched. After the first chunk,
+    the next chunks are read by continuing after the last page ID instead of using an offset.
+    This sequence can be used by the :class:`~django.core.paginator.Paginator`.
+
+    .. versionadded:: 3.1
+    """
+
+    def __init__(self, nodes, language_code=None, chunk_size=2000):
+        self.language_code = language_code or translation.get_language()
+        self.language_codes = appsettings.FLUENT_PAGES_LANGUAGES.get_active_choices(
+            self.language_code
+        )
+        self.nodes = (
+            nodes.filter(translations__language_code__in=self.language_codes)
+            .order_by("id")
+            .distinct()
+        )
+        self.chunk_size = chunk_size
+
+    def count(self):
+        return self.nodes.values("id").count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return self._iter_items(0, None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None:
+                raise ValueError("Slicing with steps is not supported")
+            return self._iter_items(index.start or 0, index.stop)
+
+        try:
+            return next(self._iter_items(index, index + 1))
+        except StopIteration:
+            raise IndexError("Sitemap index out of range")
+
+    def get_root(self, language_code=None):
+        """
+        Return the URL where the pages are mounted, this is resolved once per language.
+        """
+        return _get_url_root(language_code or self.language_code)
+
+    def get_alternates(self, node_ids, language_codes=None):
+        """
+        Return the URLs of all translations of the pages, as ``{node_id: [(language_code, url)]}``.
+        The translations of all pages are read in a single query.
+        """
+        translations = UrlNode_Translation.objects.filter(master__in=node_ids)
+        if language_codes is not None:
+            translations = translations.filter(language_code__in=language_codes)
+
+        alternates = {}
+        rows = translations.order_by("master_id", "language_code").values_list(
+            "master_id", "language_code", "_cached_url"
+        )
+        for node_id, language_code, cached_url in rows:
+            url = self.get_root(language_code) + cached_url
+            alternates.setdefault(node_id, []).append((language_code, url))
+        return alternates
+
+    def _iter_items(self, start, stop):
+        node_ids = self.nodes.values_list("id", flat=True)
+        remaining = None if stop is None else stop - start
+        root = self.get_root()
+        priorities = {code: i for i, code in enumerate(self.language_codes)}
+        offset = start
+        while remaining is None or remaining > 0:
+            # Only the first chunk uses an offset, the next chunks continue after the last ID.
+            limit = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            chunk = list(node_ids[offset : offset + limit])
+            if not chunk:
+                break
+
+            # Pick the translation in the current language, or the fallback.
+            rows = UrlNode_Translation.objects.filter(
+                master__in=chunk, language_code__in=self.language_codes
+            ).values_list("master_id", "language_code", "_cached_url", "master__modification_date")
+            best = {}
+            for row in rows:
+                current = best.get(row[0])
+                if current is None or priorities[row[1]] < priorities[current[1]]:
+                    best[row[0]] = row
+
+            for node_id in chunk:
+                node_id, language_code, cached_url, modification_date = best[node_id]
+                yield SitemapItem(node_id, language_code, root + cached_url, modification_date)
+
+            if remaining is not None:
+                remaining -= len(chunk)
+            node_ids = node_ids.filter(id__gt=chunk[-1])
+            offset = 0
 
 
 class PageSitemap(Sitemap):
     """
     The sitemap definition for the pages created with *django-fluent-pages*.
     It follows the API for the :mod:`django.contrib.sitemaps <django.contrib.sitemaps>` module.
+
+    .. versionchanged:: 3.1
+       The items are :class:`SitemapItem` tuples instead of
+       :class:`~fluent_pages.models.UrlNode` objects, which are read in chunks to support large sites.
+       Setting :attr:`alternates` adds the links to the translations of each page.
     """
 
+    #: Add a ``<xhtml:link rel="alternate" hreflang="...">`` link for each translation of the page.
+    #: The translations are limited to the :attr:`languages`, when these are defined.
+    #: Unlike the ``i18n`` option of Django, each page is still listed once per sitemap.
+    #: This requires Django 3.2 or newer, as older ``sitemap.xml`` templates don't render the links.
+    alternates = False
+
+    #: Add an ``hreflang="x-default"`` link to the translation in the ``LANGUAGE_CODE``.
+    x_default = False
+
+    def get_queryset(self):
+        """
+        Return the pages that should be listed in the sitemap.
+        """
+        return UrlNode.objects.in_sitemaps().non_polymorphic()
+
     def items(self):
         """
         Return all items of the sitemap.
         """
-        # Note that .active_translations() can't be combined with other filters for translations__.. fields.
-        return (
-            UrlNode.objects.in_sitemaps()
-            .non_polymorphic()
-            .active_translations()
-            .prefetch_related("translations")
-            .order_by("level", "translations__language_code", "translations___cached_url")
-        )
+        return SitemapItems(self.get_queryset())
+
+    def get_urls(self, page=1, site=None, protocol=None):
+        """
+        Return the URL data of a page of the sitemap, including the :attr:`alternates` links.
+        """
+        if self.alternates and django.VERSION < (3, 2):
+            # The sitemap.xml template of older Django versions doesn't render the links.
+            raise ImproperlyConfigured("PageSitemap.alternates requires Django 3.2 or newer.")
+
+        urls = super().get_urls(page=page, site=site, protocol=protocol)
+        if self.alternates and urls:
+            base_url = f"{self.get_protocol(protocol)}://{self.get_domain(site)}"
+            alternates = self.paginator.object_list.get_alternates(
+                [url_info["item"].id for url_info in urls],
+                language_codes=getattr(self, "languages", None),
+            )
+            for url_info in urls:
+                translations = dict(alternates.get(url_info["item"].id, ()))
+                url_alternates = url_info.setdefault("alternates", [])
+                for language_code, url in translations.items():
+                    url_alternates.append(
+                        {"location": base_url + url, "lang_code": language_code}
+                    )
+                if self.x_default and settings.LANGUAGE_CODE in translations:
+                    url_alternates.append(
+                        {
+                            "location": base_url + translations[settings.LANGUAGE_CODE],
+                            "lang_code": "x-default",
+                        }
+                    )
+        return urls
 
-    def lastmod(self, urlnode):
+    def lastmod(self, item):
         """Return the last modification of the page."""
-        return urlnode.last_modified
+        return item.lastmod
 
-    def location(self, urlnode):
+    def location(self, item):
         """Return url of a page."""
-        return urlnode.url
+        return item.url
+
+    def get_latest_lastmod(self):
+        """Return the last modification of all pages, for the sitemap index."""
+        return self.get_queryset().aggregate(Max("modification_date"))["modification_date__max"]
+
+
+def get_sitemap_shard(node_id):
+    """
+    Return the number of the sitemap file that contains the page.
+
+    .. versionadded:: 3.1
+    """
+    return node_id // SHARD_SIZE
+
+
+def mark_sitemap_changed(site_id, node_ids):
+    """
+    Mark the sitemap files of the pages as changed, so :func:`generate_sitemap_files` updates them.
+
+    .. versionadded:: 3.1
+    """
+    # The markers are stored in the database, so they are seen by all processes,
+    # and are not lost when the cache is cleared. Existing markers are left as-is.
+    shards = {get_sitemap_shard(node_id) for node_id in node_ids}
+    PendingSitemapShard.objects.bulk_create(
+        [PendingSitemapShard(parent_site_id=site_id, shard=shard) for shard in shards],
+        ignore_conflicts=True,
+    )
+
+
+def generate_sitemap_files(site_id, output_dir=None, protocol="https", force=False):
+    """
+    Write the sitemap files of a site, and return the number of updated shards.
+
+    For each language, the gzipped shards and a ``sitemap.xml`` index are written
+    to the :file:`{output_dir}/{site_id}/{language_code}/` directory.
+    Only the shards that were marked as changed are regenerated, unless ``force`` is set.
+    This includes the shards of pages that were (un)published by their publication dates
+    since the previous run.
+
+    .. versionadded:: 3.1
+    """
+    output_dir = output_dir or appsettings.FLUENT_PAGES_SITEMAP_DIR
+    started = now()
+    last_generated = _read_last_generated(output_dir, site_id)
+    site = Site.objects.get(pk=site_id)
+    nodes = UrlNode.objects.parent_site(site_id).in_sitemaps().non_polymorphic()
+    language_codes = sorted(
+        UrlNode_Translation.objects.filter(master__parent_site=site_id)
+        .values_list("language_code", flat=True)
+        .distinct()
+    )
+    max_id = UrlNode.objects.parent_site(site_id).aggregate(Max("id"))["id__max"] or 0
+    shards = range(get_sitemap_shard(max_id) + 1)
+
+    pending = dict(
+        PendingSitemapShard.objects.filter(parent_site=site_id).values_list("id", "shard")
+    )
+    if force or last_generated is None or not _indexes_exist(output_dir, site_id, language_codes):
+        # Also generate everything for new sites and languages.
+        changed = sorted(set(shards) | set(pending.values()))
+    else:
+        # This includes the shards of deleted pages, so their files are removed.
+        publication_shards = _get_publication_shards(site_id, last_generated, started)
+        changed = sorted(set(pending.values()) | publication_shards)
+
+    # Clear the markers first, pages that are saved while generating the files are marked again.
+    PendingSitemapShard.objects.filter(id__in=pending).delete()
+
+    base_url = f"{protocol}://{site.domain}"
+    for language_code in language_codes:
+        language_dir = os.path.join(output_dir, str(site_id), language_code)
+        os.makedirs(language_dir, exist_ok=True)
+        for shard in changed:
+            items = SitemapItems(
+                nodes.filter(id__gte=shard * SHARD_SIZE, id__lt=(shard + 1) * SHARD_SIZE),
+                language_code=language_code,
+            )
+            _write_shard(os.path.join(language_dir, f"sitemap-{shard}.xml.gz"), base_url, items)
+
+        if changed:
+            sitemap_url = appsettings.FLUENT_PAGES_SITEMAP_URL
+            index_url = f"{base_url}{sitemap_url}{site_id}/{language_code}/"
+            _write_index(language_dir, index_url)
+
+    _write_last_generated(output_dir, site_id, started)
+    return len(changed)
+
+
+def _get_publication_shards(site_id, since, until):
+    # Pages that are (un)published by their publication dates are not marked by save().
+    # The next publication change since the previous run tells whether this happened at all.
+    pages = UrlNode.objects.parent_site(site_id)
+    change = pages.next_publication_change(since)
+    if change is None or change > until:
+        return set()
+
+    node_ids = (
+        pages.filter(status=UrlNode.PUBLISHED)
+        .filter(
+            Q(publication_date__range=(since, until))
+            | Q(publication_end_date__range=(since, until))
+        )
+        .values_list("id", flat=True)
+    )
+    return {get_sitemap_shard(node_id) for node_id in node_ids}
+
+
+def _read_last_generated(output_dir, site_id):
+    try:
+        with open(os.path.join(output_dir, str(site_id), ".generated")) as file:
+            return datetime.fromisoformat(file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_last_generated(output_dir, site_id, date):
+    # The start time of the run, so publication changes during the run are seen next time.
+    site_dir = os.path.join(output_dir, str(site_id))
+    os.makedirs(site_dir, exist_ok=True)
+    with open(os.path.join(site_dir, ".generated"), "w") as file:
+        file.write(date.isoformat())
+
+
+def _indexes_exist(output_dir, site_id, language_codes):
+    return all(
+        os.path.exists(os.path.join(output_dir, str(site_id), language_code, "sitemap.xml"))
+        for language_code in language_codes
+    )
+
+
+def _write_shard(path, base_url, items):
+    # The file is written under a temporary name, so the web server never sees a partial file.
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+        file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        )
+        for item in items:
+            file.write(f"<url><loc>{escape(base_url + item.url)}</loc>")
+            if item.lastmod:
+                file.write(f"<lastmod>{item.lastmod.date().isoformat()}</lastmod>")
+            file.write("</url>\n")
+            count += 1
+        file.write("</urlset>\n")
+
+    if count:
+        os.replace(tmp_path, path)
+    else:
+        # All pages of the shard are removed.
+        os.remove(tmp_path)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _write_index(language_dir, base_url):
+    shards = sorted(
+        int(name[8:-7])
+        for name in os.listdir(language_dir)
+        if name.startswith("sitemap-") and name.endswith(".xml.gz")
+    )
+
+    path = os.path.join(language_dir, "sitemap.xml")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        )
+        for shard in shards:
+            url = f"{base_url}sitemap-{shard}.xml.gz"
+            file.write(f"<sitemap><loc>{escape(url)}</loc></sitemap>\n")
+        file.write("</sitemapindex>\n")
+    os.replace(tmp_path, path)
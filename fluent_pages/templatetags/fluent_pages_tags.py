@@ -9,11 +9,16 @@ Load this module using:
 from django.contrib.sites.models import Site
 from django.template import Library, TemplateSyntaxError
 from django.utils.functional import SimpleLazyObject
+from django.utils.translation import get_language
 from tag_parser import template_tag
 from tag_parser.basetags import BaseInclusionNode, BaseNode
 
 from fluent_pages.models import UrlNode
-from fluent_pages.models.navigation import PageNavigationNode
+from fluent_pages.models.navigation import (
+    PageNavigationNode,
+    get_cached_navigation_tree,
+    prefetch_navigation_children,
+)
 from fluent_pages.models.utils import prefill_parent_site
 
 register = Library()
@@ -78,10 +83,22 @@ class MenuNode(BaseInclusionNode):
 
         {% render_menu max_depth=1 template="fluent_pages/parts/menu.html" %}
         {% render_menu parent="/page/url/" max_depth=1 template="fluent_pages/parts/menu.html" %}
+
+    Use ``prefetch=True`` to fetch all menu levels at once, instead of running a query per sub menu:
+
+    .. code-block:: html+django
+
+        {% render_menu max_depth=3 prefetch=True %}
+
+    Use ``cache=True`` to render the toplevel menu from a cached copy of the menu pages:
+
+    .. code-block:: html+django
+
+        {% render_menu max_depth=3 cache=True %}
     """
 
     template_name = "fluent_pages/parts/menu.html"
-    allowed_kwargs = ("max_depth", "template", "parent")
+    allowed_kwargs = ("max_depth", "template", "parent", "prefetch", "cache")
 
     def get_context_data(self, parent_context, *tag_args, **tag_kwargs):
         # Get page objects
@@ -117,6 +134,15 @@ class MenuNode(BaseInclusionNode):
                 raise TemplateSyntaxError(
                     "The 'render_menu' tag only allows an URL path, page id or page object for the 'parent' keyword"
                 )
+        elif tag_kwargs.get("cache") and _is_menu_language(current_page):
+            # The menu is identical for all visitors, only the active item differs.
+            node_kwargs = get_node_kwargs(tag_kwargs)
+            tree = get_cached_navigation_tree(for_user=user, **node_kwargs)
+            return {
+                "parent": parent_context,
+                "request": request,
+                "menu_items": tree.get_nodes(current_page=current_page, **node_kwargs),
+            }
         else:
             # otherwise get the top level nav for the current page
             top_pages = UrlNode.objects.toplevel_navigation(
@@ -125,6 +151,12 @@ class MenuNode(BaseInclusionNode):
 
         # Construct a PageNavigationNode for every page, that allows simple iteration of the tree.
         node_kwargs = get_node_kwargs(tag_kwargs)
+        if tag_kwargs.get("prefetch"):
+            top_pages = list(top_pages.prefetch_related("translations"))
+            node_kwargs["prefetched_children"] = prefetch_navigation_children(
+                top_pages, current_page=current_page, for_user=user, **node_kwargs
+            )
+
         return {
             "parent": parent_context,
             "request": request,
@@ -221,6 +253,16 @@ def _get_current_page(context):
     return request._current_fluent_page  # is a UrlNode
 
 
+def _is_menu_language(current_page):
+    """
+    Tell whether the toplevel menu would be displayed in the current language.
+    This mirrors the language selection of ``UrlNode.objects.toplevel_navigation()``.
+    """
+    if current_page is None or getattr(current_page, "_fetched_in_fallback_language", False):
+        return True
+    return current_page.get_current_language() == get_language()
+
+
 def _get_request(context):
     """
     Fetch the request from the context.
@@ -1,5 +1,7 @@
+from django.core.cache import cache
+
 from fluent_pages.models import Page
-from fluent_pages.models.navigation import PageNavigationNode
+from fluent_pages.models.navigation import PageNavigationNode, prefetch_navigation_children
 from fluent_pages.tests.testapp.models import SimpleTextPage
 from fluent_pages.tests.utils import AppTestCase
 
@@ -42,6 +44,13 @@ class MenuTests(AppTestCase):
             status=SimpleTextPage.PUBLISHED,
             author=cls.user,
         )
+        level2 = SimpleTextPage.objects.create(
+            title="Level2",
+            slug="level2",
+            parent=level1a,
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+        )
 
     def test_navigation(self):
         """
@@ -123,3 +132,61 @@ class MenuTests(AppTestCase):
 
         self.assertEqual(children[0].is_active, True)
         self.assertEqual(children[1].is_active, False)
+
+    def test_prefetch_sub_menu_items(self):
+        """
+        The menu API should be able to read all levels at once.
+        """
+        current_page = Page.objects.get(translations__slug="level2")
+
+        nav = list(Page.objects.toplevel_navigation(current_page=current_page))
+        with self.assertNumQueries(2):  # subtree + translations
+            children = prefetch_navigation_children(nav, current_page=current_page)
+        menu = [
+            PageNavigationNode(page, current_page=current_page, prefetched_children=children)
+            for page in nav
+        ]
+
+        def _read_tree(nodes):
+            return [(node.title, node.is_active, _read_tree(node.children)) for node in nodes]
+
+        self.assertNumQueries(
+            0,
+            lambda: self.assertEqual(
+                _read_tree(menu),
+                [
+                    (
+                        "Home",
+                        False,
+                        [("Level1a", False, [("Level2", True, [])]), ("Level1b", False, [])],
+                    ),
+                    ("Root2", False, []),
+                ],
+            ),
+        )
+
+        # The max_depth should be honored as well
+        children = prefetch_navigation_children(nav, max_depth=2)
+        menu = [
+            PageNavigationNode(page, max_depth=2, prefetched_children=children) for page in nav
+        ]
+        self.assertEqual([child.slug for child in menu[0].children], ["level1a", "level1b"])
+        self.assertEqual(list(list(menu[0].children)[0].children), [])
+        self.assertNotIn(list(menu[0].children)[0].page.pk, children)
+
+    def test_breadcrumb(self):
+        """
+        The breadcrumb should fetch all ancestors with their translations at once.
+        """
+        page = Page.objects.get(translations__slug="level2")
+        self.assertEqual(page.url, "/level1a/level2/")
+        cache.clear()  # avoid reading the translations from the cache.
+
+        # ancestors, their page type models, and their translations.
+        with self.assertNumQueries(3):
+            breadcrumb = [(node.title, node.url) for node in page.breadcrumb]
+
+        self.assertEqual(
+            breadcrumb,
+            [("Home", "/"), ("Level1a", "/level1a/"), ("Level2", "/level1a/level2/")],
+        )
@@ -1,10 +1,48 @@
+import json
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
 from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import set_script_prefix
 from django.utils.encoding import force_str
-
-from fluent_pages.models import HtmlPage, Page, ParentTranslationDoesNotExist, UrlNode
+from django.utils.timezone import now
+
+from fluent_pages import appsettings
+from fluent_pages.cache import (
+    LAYOUT,
+    PUBLICATION,
+    TREE,
+    get_cache_version,
+    get_publication_timeout,
+    increase_cache_version,
+)
+from fluent_pages.checks import check_cache_backend, check_shared_cache
+from fluent_pages.management.commands import rebuild_page_tree
+from fluent_pages.models import (
+    HtmlPage,
+    Page,
+    PageLayout,
+    ParentTranslationDoesNotExist,
+    UrlNode,
+    UrlNode_Translation,
+)
+from fluent_pages.models.db import PendingUrlRebuild
 from fluent_pages.models.fields import PageTreeForeignKey
+from fluent_pages.models.integrity import TreeProblem, check_page_tree
 from fluent_pages.models.managers import UrlNodeManager, UrlNodeQuerySet
+from fluent_pages.models.rebuild import process_url_rebuilds
+from fluent_pages.signals import cache_version_changed
 from fluent_pages.tests.testapp.models import PlainTextFile, SimpleTextPage, WebShopPage
 from fluent_pages.tests.utils import AppTestCase
 
@@ -135,6 +173,43 @@ class ModelDataTests(AppTestCase):
             ["level1/", "level1/level2"],
         )
 
+    def test_with_all_urls(self):
+        """
+        The URLs of all nodes can be fetched at once, e.g. for str() in a list of nodes.
+        """
+        with self.assertNumQueries(2):
+            nodes = list(UrlNode.objects.with_all_urls().non_polymorphic().order_by("lft", "id"))
+        with self.assertNumQueries(0):
+            urls = {node.pk: node.get_absolute_urls() for node in nodes}
+            str(nodes[0])
+
+        self.assertEqual(urls[self.level2.pk], {"en-us": "/level1/level2/"})
+        self.assertEqual(urls[self.level2.pk], self.level2.get_absolute_urls())
+
+    def test_url_root(self):
+        """
+        The URL root is remembered, but still follows the script prefix.
+        """
+        self.assertEqual(self.level2.default_url, "/level1/level2/")
+        set_script_prefix("/site/")
+        try:
+            self.assertEqual(self.level2.default_url, "/site/level1/level2/")
+        finally:
+            set_script_prefix("/")
+        self.assertEqual(self.level2.default_url, "/level1/level2/")
+
+    def test_get_absolute_url_format(self):
+        """
+        The URL format for the slug preview reads the parent URL, unless it's customized.
+        """
+        level2 = SimpleTextPage.objects.get(pk=self.level2.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(level2.get_absolute_url_format(), "/level1/{slug}/")
+
+        overrides = {"fluent_pages.urlnode": lambda o: "http://example.com" + o.default_url}
+        with override_settings(ABSOLUTE_URL_OVERRIDES=overrides):
+            self.assertIsNone(level2._read_parent_url())
+
     def test_polymorphic(self):
         """
         The API should return the polymorphic objects
@@ -194,6 +269,252 @@ class ModelDataTests(AppTestCase):
         self.assertEqual(len(pages1), 1)
         self.assertEqual(len(pages2), 1)
 
+    def test_next_publication_change(self):
+        """
+        The next publication date or end date should be found, ignoring past dates and drafts.
+        """
+        self.assertIsNone(Page.objects.next_publication_change())
+        self.assertIsNone(get_publication_timeout(self.root.parent_site_id))
+        self.assertEqual(get_publication_timeout(self.root.parent_site_id, 3600), 3600)
+
+        soon = now() + timedelta(minutes=10)
+        later = now() + timedelta(days=1)
+        self.level1.publication_end_date = later
+        self.level1.save()
+        self.level2.publication_date = now() - timedelta(days=1)
+        self.level2.publication_end_date = soon
+        self.level2.save()
+        self.draft1.publication_date = now() + timedelta(minutes=1)
+        self.draft1.save()
+
+        self.assertEqual(Page.objects.next_publication_change(), soon)
+        self.assertEqual(Page.objects.next_publication_change(soon + timedelta(seconds=1)), later)
+        self.assertTrue(590 < get_publication_timeout(self.root.parent_site_id, 3600) <= 601)
+
+    def test_cache_version(self):
+        """
+        Changes should increase the cache versions of the site, and send a signal.
+        """
+        site_id = self.root.parent_site_id
+        received = []
+
+        def receiver(site_id, scopes, **kwargs):
+            received.append((site_id, scopes))
+
+        cache_version_changed.connect(receiver)
+        try:
+            tree = get_cache_version(site_id, (TREE,))
+            publication = get_cache_version(site_id, (PUBLICATION,))
+            layout = get_cache_version(site_id, (LAYOUT,))
+
+            # A title change only affects the tree, and expires the caches once.
+            self.level1.title = "Level1 updated"
+            self.level1.slug = "level1-updated"
+            self.level1.save()
+            self.assertEqual(received, [(site_id, (TREE,))])
+            self.assertNotEqual(get_cache_version(site_id, (TREE,)), tree)
+            self.assertEqual(get_cache_version(site_id, (PUBLICATION,)), publication)
+
+            # Unpublishing changes which pages are visible.
+            self.level1.status = Page.DRAFT
+            self.level1.save()
+            self.assertNotEqual(get_cache_version(site_id, (PUBLICATION,)), publication)
+
+            # Layouts are shared by all sites.
+            self.assertEqual(get_cache_version(site_id, (LAYOUT,)), layout)
+            PageLayout.objects.create(key="test", title="Test", template_path="test.html")
+            self.assertNotEqual(get_cache_version(site_id, (LAYOUT,)), layout)
+        finally:
+            cache_version_changed.disconnect(receiver)
+
+    def test_cache_version_not_stored(self):
+        """
+        When the cache doesn't store the versions, they're kept in the process.
+        """
+        site_id = self.root.parent_site_id
+        with patch("fluent_pages.cache.cache", DummyCache("dummy", {})):
+            tree = get_cache_version(site_id, (TREE,))
+            self.assertEqual(get_cache_version(site_id, (TREE,)), tree)
+            increase_cache_version(site_id, (TREE,))
+            self.assertNotEqual(get_cache_version(site_id, (TREE,)), tree)
+
+    def test_cache_backend_check(self):
+        """
+        The in-process caches need a cache backend that is shared between processes.
+        """
+        self.assertEqual(check_cache_backend(), [])
+        with patch.object(appsettings, "FLUENT_PAGES_ROUTING_TABLE", True):
+            errors = check_cache_backend()
+        self.assertEqual([error.id for error in errors], ["fluent_pages.E001"])
+
+        # The deployment check warns that app_reverse() is not remembered between requests.
+        self.assertEqual([error.id for error in check_shared_cache()], ["fluent_pages.W001"])
+        with patch("fluent_pages.checks.is_cache_shared", return_value=True):
+            self.assertEqual(check_shared_cache(), [])
+
+    def test_update_decendant_urls(self):
+        """
+        Changing a slug should update the URLs of all sub pages with a single update.
+        """
+        for i in range(3):
+            SimpleTextPage.objects.create(
+                title=f"Level3-{i}",
+                slug=f"level3-{i}",
+                parent=self.level2,
+                status=SimpleTextPage.PUBLISHED,
+                author=self.user,
+            )
+
+        level1 = SimpleTextPage.objects.get(pk=self.level1.pk)
+        level1.slug = "level1-new"
+        with CaptureQueriesContext(connection) as queries:
+            level1.save()
+
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "fluent_pages_urlnode_translation"')
+        ]
+        self.assertEqual(len(updates), 2)  # the page itself, and all sub pages.
+
+        self.assertUrls(self.level2, {"en-us": "/level1-new/level2/"})
+        for page in SimpleTextPage.objects.filter(parent=self.level2):
+            self.assertTrue(page.get_absolute_url().startswith("/level1-new/level2/level3-"))
+
+    @patch.object(appsettings, "FLUENT_PAGES_DEFER_URL_REBUILD", "command")
+    def test_deferred_url_rebuild(self):
+        """
+        The sub pages should be updated later, and be found by their new URL in the meantime.
+        """
+        level1 = SimpleTextPage.objects.get(pk=self.level1.pk)
+        level1.slug = "level1-new"
+        level1.save()
+        level1.slug = "level1-newer"  # renaming twice keeps the oldest URL.
+        level1.save()
+
+        self.assertEqual(PendingUrlRebuild.objects.count(), 1)
+        self.assertUrls(self.level2, {"en-us": "/level1/level2/"})
+
+        level2 = Page.objects.get_for_path("/level1-newer/level2/")
+        self.assertEqual(level2, self.level2)
+        self.assertEqual(level2.get_absolute_url(), "/level1-newer/level2/")
+        self.assertRaises(
+            Page.DoesNotExist, lambda: Page.objects.get_for_path("/level1-new/level2/")
+        )
+
+        self.assertEqual(process_url_rebuilds(), 1)
+        self.assertEqual(PendingUrlRebuild.objects.count(), 0)
+        self.assertUrls(self.level2, {"en-us": "/level1-newer/level2/"})
+        self.assertEqual(Page.objects.get_for_path("/level1-newer/level2/"), self.level2)
+
+    @patch.object(appsettings, "FLUENT_PAGES_DEFER_URL_REBUILD", "command")
+    def test_deferred_url_rebuild_failure(self):
+        """
+        A failed rebuild should stay in the queue, and not break the other rebuilds.
+        """
+
+        calls = []
+
+        def update_decendant_urls(node, translation):
+            calls.append(translation.language_code)
+            if len(calls) == 1:
+                # Like a failing bulk update, which marks the transaction for rollback.
+                with transaction.atomic(savepoint=False):
+                    raise DatabaseError("failed")
+
+        SimpleTextPage.objects.create(title="Sub", slug="sub", parent=self.root2, author=self.user)
+        for page, slug in ((self.level1, "level1-new"), (self.root2, "root2-new")):
+            page = SimpleTextPage.objects.get(pk=page.pk)
+            page.slug = slug
+            page.save()
+
+        with patch.object(UrlNode, "_update_decendant_urls", update_decendant_urls):
+            with self.assertLogs("fluent_pages.models.rebuild", "ERROR"):
+                self.assertEqual(process_url_rebuilds(), 2)
+        self.assertEqual(len(calls), 2)
+
+        # The sub pages can still be found by their new URL, the failed rebuild is not retried.
+        rebuild = PendingUrlRebuild.objects.get()
+        self.assertTrue(rebuild.failed)
+        self.assertEqual(rebuild.new_url, "/level1-new/")
+        self.assertEqual(process_url_rebuilds(), 0)
+        self.assertEqual(Page.objects.get_for_path("/level1-new/level2/"), self.level2)
+
+        # Changing the URL again retries the rebuild.
+        level1 = SimpleTextPage.objects.get(pk=self.level1.pk)
+        level1.slug = "level1-newer"
+        level1.save()
+        self.assertEqual(process_url_rebuilds(), 1)
+        self.assertEqual(PendingUrlRebuild.objects.count(), 0)
+        self.assertUrls(self.level2, {"en-us": "/level1-newer/level2/"})
+
+    @patch.object(appsettings, "FLUENT_PAGES_DEFER_URL_REBUILD", "command")
+    @patch("fluent_pages.models.rebuild.is_cache_shared", return_value=True)
+    def test_deferred_url_rebuild_empty_queue(self, mock):
+        """
+        Paths that are not found should not query the queue when it's empty.
+        """
+        self.assertRaises(Page.DoesNotExist, lambda: Page.objects.get_for_path("/missing/"))
+        with self.assertNumQueries(1):
+            self.assertRaises(Page.DoesNotExist, lambda: Page.objects.get_for_path("/missing/"))
+
+        level1 = SimpleTextPage.objects.get(pk=self.level1.pk)
+        level1.slug = "level1-new"
+        level1.save()
+        self.assertEqual(Page.objects.get_for_path("/level1-new/level2/"), self.level2)
+
+    def test_rebuild_page_tree(self):
+        """
+        The rebuild_page_tree command should restore the URLs in bulk.
+        """
+        UrlNode_Translation.objects.filter(master__in=(self.level1, self.level2)).update(
+            _cached_url="/broken/"
+        )
+
+        stdout = StringIO()
+        call_command("rebuild_page_tree", language="fr", stdout=stdout)
+        self.assertIn("Updated 0 of 0 URLs", stdout.getvalue())
+        self.assertUrls(self.level2, {"en-us": "/broken/"})
+
+        stdout = StringIO()
+        call_command("rebuild_page_tree", site=self.level1.parent_site_id, stdout=stdout)
+        self.assertIn("Updated 2 of 6 URLs", stdout.getvalue())
+        self.assertUrls(self.level1, {"en-us": "/level1/"})
+        self.assertUrls(self.level2, {"en-us": "/level1/level2/"})
+        self.assertEqual(
+            UrlNode.objects.get_for_path("/level1/level2/").get_absolute_url(), "/level1/level2/"
+        )
+
+    def test_check_page_tree(self):
+        """
+        The tree checker should report broken MPTT fields and URLs, and fix them.
+        """
+        self.assertEqual(list(check_page_tree()), [])
+
+        UrlNode_Translation.objects.filter(master=self.level2).update(_cached_url="/broken/")
+        UrlNode.objects.filter(pk=self.root2.pk).update(level=3)
+        problems = list(check_page_tree())
+        level2, root2 = self.level2, self.root2
+        self.assertEqual(
+            problems,
+            [
+                TreeProblem(
+                    "url", level2.tree_id, level2.pk, "en-us", "/level1/level2/", "/broken/"
+                ),
+                TreeProblem("level", root2.tree_id, root2.pk, None, 0, 3),
+            ],
+        )
+        self.assertEqual(list(check_page_tree(language_code="nl")), [problems[1]])
+
+        stdout = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("check_page_tree", json=True, stdout=stdout)
+        self.assertEqual(json.loads(stdout.getvalue().splitlines()[0])["kind"], "url")
+
+        call_command("check_page_tree", fix=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(list(check_page_tree()), [])
+        self.assertUrls(self.level2, {"en-us": "/level1/level2/"})
+
     def test_move_root(self):
         """
         Moving the root node should update all child node URLs. (they are precalculated/cached in the DB)
@@ -350,6 +671,95 @@ class ModelDataTests(AppTestCase):
         page5.save()
         self.assertEqual(page5.slug, "dup-slug-5")
 
+    def test_duplicate_slug_queries(self):
+        """
+        The duplicate slugs should be found in a single query, for all translations.
+        """
+        for i in range(4):
+            SimpleTextPage.objects.language("en").create(slug="dup-slug", author=self.user)
+
+        page = SimpleTextPage(author=self.user)
+        page.set_current_language("en")
+        page.slug = "dup-slug"
+        page.set_current_language("fr")
+        page.slug = "dup-slug"
+        with CaptureQueriesContext(connection) as queries:
+            page.save()
+
+        slug_queries = [query for query in queries.captured_queries if "LIKE" in query["sql"]]
+        self.assertEqual(len(slug_queries), 1)
+        self.assertEqual(page.safe_translation_getter("slug", language_code="en"), "dup-slug-5")
+        self.assertEqual(page.safe_translation_getter("slug", language_code="fr"), "dup-slug")
+
+    def test_bulk_create_tree(self):
+        """
+        Bulk creating pages should produce the same tree as saving each page.
+        """
+        section = SimpleTextPage(title="Section", slug="level1", author=self.user, contents="A")
+        section.meta_title = "Section title"
+        sub1 = SimpleTextPage(title="Sub", author=self.user, contents="B")
+        sub2 = SimpleTextPage(title="Sub", author=self.user, contents="C")
+        readme = PlainTextFile(slug="README", author=self.user, content="D")
+        root3 = SimpleTextPage(title="Root2", author=self.user, contents="E")
+
+        tree = [(section, [sub1, sub2, readme])]
+        nodes = UrlNode.objects.bulk_create_tree(tree, parent=self.root)
+        self.assertEqual(nodes, [section, sub1, sub2, readme])
+        UrlNode.objects.bulk_create_tree([root3])
+
+        # Slugs are unique, and the URLs are generated.
+        self.assertUrls(section, {"en-us": "/level1-2/"})
+        self.assertUrls(sub1, {"en-us": "/level1-2/sub/"})
+        self.assertUrls(sub2, {"en-us": "/level1-2/sub-2/"})
+        self.assertUrls(readme, {"en-us": "/level1-2/README"})
+        self.assertUrls(root3, {"en-us": "/root2-2/"})
+
+        # The page type tables are filled
+        page = UrlNode.objects.get_for_path("/level1-2/sub-2/")
+        self.assertIsInstance(page, SimpleTextPage)
+        self.assertEqual(page.contents, "C")
+        self.assertEqual(UrlNode.objects.get_for_path("/level1-2/README").content, "D")
+        self.assertEqual(UrlNode.objects.get(pk=section.pk).meta_title, "Section title")
+
+        # The MPTT fields are identical to a rebuild.
+        mptt_fields = ("id", "parent_id", "tree_id", "lft", "rght", "level")
+        before = list(UrlNode.objects.order_by("id").values_list(*mptt_fields))
+        UrlNode.objects.rebuild()
+        self.assertEqual(list(UrlNode.objects.order_by("id").values_list(*mptt_fields)), before)
+
+        # Like save(), the parent needs a URL in the same language, and can't be a file.
+        page = SimpleTextPage(author=self.user, contents="F")
+        page.set_current_language("en")
+        page.title = "English"
+        self.assertRaises(
+            ParentTranslationDoesNotExist,
+            lambda: UrlNode.objects.bulk_create_tree([page], parent=section),
+        )
+        self.assertRaisesMessage(
+            ValidationError,
+            force_str(PageTreeForeignKey.default_error_messages["no_children_allowed"]),
+            lambda: UrlNode.objects.bulk_create_tree(
+                [SimpleTextPage(title="Sub", author=self.user)], parent=readme
+            ),
+        )
+
+    def test_bulk_create_tree_without_returning(self):
+        """
+        Databases that don't return the IDs of a bulk insert should read them back.
+        """
+        section = SimpleTextPage(title="Import", author=self.user, contents="A")
+        sub1 = SimpleTextPage(title="Sub1", author=self.user, contents="B")
+        sub2 = SimpleTextPage(title="Sub2", author=self.user, contents="C")
+        features = type(connection.features)
+        with patch.object(features, "can_return_rows_from_bulk_insert", False):
+            nodes = UrlNode.objects.bulk_create_tree([(section, [sub1, sub2])], parent=self.root)
+
+        self.assertTrue(all(node.pk for node in nodes))
+        self.assertEqual(sub1.parent_id, section.pk)
+        self.assertUrls(sub2, {"en-us": "/import/sub2/"})
+        self.assertEqual(UrlNode.objects.get_for_path("/import/sub1/").contents, "B")
+        self.assertEqual(UrlNode.objects.get(pk=sub2.pk).parent_id, section.pk)
+
     def test_file_model_urls(self):
         """
         When a plugin type is marked as "file" behave accordingly.
@@ -371,6 +781,13 @@ class ModelDataTests(AppTestCase):
         )
         self.assertEqual(text_file2.get_absolute_url(), "/level1/README")  # No slash!
 
+        # Renaming the parent also keeps the URL without slash.
+        level1 = SimpleTextPage.objects.get(pk=self.level1.pk)
+        level1.slug = "level1-renamed"
+        level1.save()
+        self.assertUrls(text_file2, {"en-us": "/level1-renamed/readme"})
+        self.assertEqual(list(check_page_tree(tree_ids=[level1.tree_id])), [])
+
     def test_file_model_parent(self):
         """
         A file model does not allow children.
@@ -416,3 +833,62 @@ class ModelDataTests(AppTestCase):
         self.assertEqual(page.default_url, "/admin-en/")
         page.set_current_language("nl", initialize=True)
         self.assertIsNone(page.default_url)
+
+
+class RebuildPageTreeTests(TransactionTestCase):
+    """
+    Tests for the ``rebuild_page_tree`` command, which commits in worker threads.
+    """
+
+    def setUp(self):
+        cache.clear()
+        Site.objects.get_or_create(
+            id=settings.SITE_ID,
+            defaults=dict(domain="django.localhost", name="django at localhost"),
+        )
+        self.user = get_user_model().objects.create(username="fluent-pages-admin")
+        self.root = SimpleTextPage.objects.create(title="Root", slug="root", author=self.user)
+        self.sub = SimpleTextPage.objects.create(
+            title="Sub", slug="sub", parent=self.root, author=self.user
+        )
+        self.root2 = SimpleTextPage.objects.create(title="Root2", slug="root2", author=self.user)
+        self.roots = [self.root, self.root2]
+        for i in range(3, 7):
+            root = SimpleTextPage.objects.create(
+                title=f"Root{i}", slug=f"root{i}", author=self.user
+            )
+            SimpleTextPage.objects.create(title="Sub", slug="sub", parent=root, author=self.user)
+            self.roots.append(root)
+
+    def test_parallel(self):
+        """
+        The trees can be rebuild concurrently.
+        """
+        UrlNode.objects.filter(pk=self.sub.pk).update(lft=10, rght=11)
+        UrlNode_Translation.objects.exclude(master=self.root).update(_cached_url="/broken/")
+
+        # Each worker handles multiple trees, sharing the memoized URLs of the command.
+        threads = set()
+        update_urls = rebuild_page_tree.Command._update_urls
+
+        def _update_urls(command, *args):
+            threads.add(threading.get_ident())
+            return update_urls(command, *args)
+
+        stdout = StringIO()
+        with patch.object(rebuild_page_tree.Command, "_update_urls", _update_urls):
+            call_command("rebuild_page_tree", parallel=2, stdout=stdout)
+        self.assertEqual(len(threads), 2)
+        self.assertIn("Rebuilding 6 trees with 2 workers", stdout.getvalue())
+        self.assertIn("Updated 10 of 11 URLs", stdout.getvalue())
+
+        urls = dict(UrlNode_Translation.objects.values_list("master_id", "_cached_url"))
+        self.assertEqual(urls[self.sub.pk], "/root/sub/")
+        self.assertEqual(urls[self.root2.pk], "/root2/")
+        for i, root in enumerate(self.roots[2:], 3):
+            self.assertEqual(urls[root.pk], f"/root{i}/")
+            child = UrlNode.objects.get(parent=root)
+            self.assertEqual(urls[child.pk], f"/root{i}/sub/")
+        self.assertEqual(
+            UrlNode.objects.filter(pk=self.sub.pk).values_list("lft", "rght").get(), (2, 3)
+        )
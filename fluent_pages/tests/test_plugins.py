@@ -1,5 +1,12 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
 from django.test import override_settings
+from django.urls import NoReverseMatch, set_script_prefix
+from django.utils.translation import get_language
 
+from fluent_pages import urlresolvers
 from fluent_pages.tests.testapp.models import WebShopPage
 from fluent_pages.tests.utils import AppTestCase
 from fluent_pages.urlresolvers import (
@@ -15,6 +22,10 @@ class PluginTests(AppTestCase):
     Test cases for plugins
     """
 
+    def setUp(self):
+        # The pages of other tests are rolled back, but not their cached results.
+        cache.clear()
+
     @classmethod
     def setUpTree(cls):
         WebShopPage.objects.create(
@@ -39,6 +50,21 @@ class PluginTests(AppTestCase):
         match = resolver.resolve("/")
         self.assertEqual(match.func, webshop_index)
 
+    def test_url_pattern_plugins_for_name(self):
+        """
+        The plugin pool should index which plugins provide an URL name.
+        """
+        from fluent_pages.extensions import page_type_pool
+        from fluent_pages.tests.testapp.page_type_plugins import WebShopPagePlugin
+        from fluent_pages.tests.testapp.urls_webshop import webshop_index
+
+        for viewname in ("webshop_index", webshop_index):
+            plugins = page_type_pool.get_url_pattern_plugins_for_name(viewname)
+            self.assertEqual([plugin.__class__ for plugin in plugins], [WebShopPagePlugin])
+
+        self.assertEqual(page_type_pool.get_url_pattern_plugins_for_name("unknown_view"), [])
+        self.assertRaises(NoReverseMatch, lambda: app_reverse("unknown_view"))
+
     # TODO: test more stuff.
     # e.g. registration API, supported fields, expected available API functions
 
@@ -85,6 +111,58 @@ class PluginTests(AppTestCase):
             "/shop2/foobar/",
         )
 
+    def test_app_reverse_memo(self):
+        """
+        The app_reverse function should remember the results until the page tree changes.
+        """
+        request_started.send(sender=self.__class__)
+        try:
+            self.assertEqual(app_reverse("webshop_index"), "/shop/")
+            with self.assertNumQueries(0):
+                self.assertEqual(app_reverse("webshop_index"), "/shop/")
+
+            # The URL includes the script prefix, which is not remembered.
+            set_script_prefix("/site/")
+            try:
+                self.assertEqual(app_reverse("webshop_index"), "/site/shop/")
+            finally:
+                set_script_prefix("/")
+            self.assertEqual(app_reverse("webshop_index"), "/shop/")
+
+            WebShopPage.objects.create(
+                title="Shop2", slug="shop2", status=WebShopPage.PUBLISHED, author=self.user
+            )
+            self.assertRaises(MultipleReverseMatch, lambda: app_reverse("webshop_index"))
+        finally:
+            request_finished.send(sender=self.__class__)
+
+    def test_app_reverse_memo_local_cache(self):
+        """
+        With a cache per process, the results should only be remembered during the request.
+        Other processes wouldn't notice that the page tree changed.
+        """
+        memo_key = urlresolvers._get_memo_key(
+            "webshop_index", [], {}, False, False, None, get_language()
+        )
+        self.assertEqual(app_reverse("webshop_index"), "/shop/")
+        self.assertNotIn(memo_key, urlresolvers._get_reverse_memo())
+
+        with patch("fluent_pages.cache.is_cache_shared", return_value=True):
+            self.assertEqual(app_reverse("webshop_index"), "/shop/")
+            self.assertIn(memo_key, urlresolvers._get_reverse_memo())
+
+    def test_app_reverse_cache_timeout(self):
+        """
+        The mounted pages should be cached for an hour at most, when no publication is scheduled.
+        """
+        with patch.object(cache, "set", wraps=cache.set) as mock:
+            self.assertEqual(app_reverse("webshop_index"), "/shop/")
+
+        timeouts = [
+            call.args[2] for call in mock.call_args_list if ".instance_of." in call.args[0]
+        ]
+        self.assertEqual(timeouts, [3600])
+
     def test_app_reverse_multiple_language(self):
         """
         The app_reverse functions should skip pages that are not translated in the current language.
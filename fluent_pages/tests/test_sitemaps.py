@@ -0,0 +1,185 @@
+import gzip
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.sites.models import Site
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.utils.timezone import now
+
+from fluent_pages import appsettings, sitemaps
+from fluent_pages.sitemaps import PageSitemap, SitemapItem, generate_sitemap_files
+from fluent_pages.tests.testapp.models import SimpleTextPage
+from fluent_pages.tests.utils import AppTestCase
+
+
+class SitemapTests(AppTestCase):
+    """
+    Tests for the sitemap integration.
+    """
+
+    @classmethod
+    def setUpTree(cls):
+        cls.root = SimpleTextPage.objects.create(
+            title="Home",
+            slug="home",
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+            override_url="/",
+        )
+        cls.level1 = SimpleTextPage.objects.create(
+            title="Level1",
+            slug="level1",
+            parent=cls.root,
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+        )
+        SimpleTextPage.objects.create(
+            title="Draft",
+            slug="draft",
+            parent=cls.root,
+            status=SimpleTextPage.DRAFT,
+            author=cls.user,
+        )
+        SimpleTextPage.objects.create(
+            title="Hidden",
+            slug="hidden",
+            parent=cls.root,
+            status=SimpleTextPage.PUBLISHED,
+            in_sitemaps=False,
+            author=cls.user,
+        )
+        cls.root2 = SimpleTextPage.objects.create(
+            title="Root2",
+            slug="root2",
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+        )
+
+    def test_items(self):
+        """
+        The sitemap only lists the published pages.
+        """
+        items = PageSitemap().items()
+        self.assertEqual(items.count(), 3)
+        self.assertEqual(
+            [(item.id, item.url) for item in items],
+            [(self.root.pk, "/"), (self.level1.pk, "/level1/"), (self.root2.pk, "/root2/")],
+        )
+        self.assertIsInstance(items[1], SitemapItem)
+
+    def test_pagination(self):
+        """
+        The pages of the sitemap are read in chunks, starting at the offset.
+        """
+        sitemap = PageSitemap()
+        sitemap.limit = 2
+        site = Site.objects.get_current()
+        self.assertEqual(sitemap.paginator.num_pages, 2)
+
+        self.assertEqual(
+            [url["location"] for url in sitemap.get_urls(page=1, site=site, protocol="https")],
+            [f"https://{site.domain}/", f"https://{site.domain}/level1/"],
+        )
+        with self.assertNumQueries(3):
+            urls = sitemap.get_urls(page=2, site=site, protocol="https")
+        self.assertEqual([url["location"] for url in urls], [f"https://{site.domain}/root2/"])
+        self.assertEqual(urls[0]["lastmod"], self.root2.modification_date)
+
+    def test_alternates(self):
+        """
+        The links to the translations are read in a single query.
+        """
+        root2 = SimpleTextPage.objects.get(pk=self.root2.pk)
+        root2.set_current_language("nl")
+        root2.title = "Wortel2"
+        root2.slug = "wortel2"
+        root2.save()
+
+        sitemap = PageSitemap()
+        sitemap.alternates = True
+        sitemap.x_default = True
+        site = Site.objects.get_current()
+        with self.assertNumQueries(4):
+            urls = sitemap.get_urls(site=site, protocol="https")
+
+        self.assertEqual(
+            [alternate["lang_code"] for alternate in urls[0]["alternates"]], ["en-us", "x-default"]
+        )
+        self.assertEqual(
+            urls[2]["alternates"],
+            [
+                {"location": f"https://{site.domain}/root2/", "lang_code": "en-us"},
+                {"location": f"https://{site.domain}/wortel2/", "lang_code": "nl"},
+                {"location": f"https://{site.domain}/root2/", "lang_code": "x-default"},
+            ],
+        )
+
+        # Older Django versions don't render the links.
+        with patch("django.VERSION", (3, 1, 0, "final", 0)):
+            sitemap = PageSitemap()
+            sitemap.alternates = True
+            self.assertRaises(ImproperlyConfigured, lambda: sitemap.get_urls(site=site))
+
+    def test_generate_sitemap_files(self):
+        """
+        The sitemap files are written per language, and only changed files are regenerated.
+        """
+        site_id = self.root.parent_site_id
+        domain = Site.objects.get(pk=site_id).domain
+        with tempfile.TemporaryDirectory() as output_dir, patch.object(
+            appsettings, "FLUENT_PAGES_SITEMAP_DIR", output_dir
+        ), patch.object(sitemaps, "SHARD_SIZE", 1):
+            self.assertEqual(generate_sitemap_files(site_id), self.root2.pk + 1)
+            language_dir = os.path.join(output_dir, str(site_id), "en-us")
+            with gzip.open(os.path.join(language_dir, f"sitemap-{self.level1.pk}.xml.gz")) as file:
+                self.assertIn(f"<loc>https://{domain}/level1/</loc>".encode(), file.read())
+            with open(os.path.join(language_dir, "sitemap.xml")) as file:
+                index = file.read()
+            self.assertEqual(index.count("<sitemap>"), 3)
+            self.assertIn(
+                f"<loc>https://{domain}/sitemaps/{site_id}/en-us/sitemap-{self.root2.pk}.xml.gz",
+                index,
+            )
+
+            self.assertEqual(generate_sitemap_files(site_id), 0)
+            SimpleTextPage.objects.get(pk=self.level1.pk).save()
+            self.assertEqual(generate_sitemap_files(site_id), 1)
+
+            output = StringIO()
+            call_command("generate_sitemaps", site=site_id, force=True, stdout=output)
+            self.assertIn(f"updated {self.root2.pk + 1} sitemap files", output.getvalue())
+
+    def test_generate_sitemap_files_publication_date(self):
+        """
+        Pages that are published by their publication date should be added to the sitemap files.
+        """
+        site_id = self.root.parent_site_id
+        scheduled = SimpleTextPage.objects.create(
+            title="Scheduled",
+            slug="scheduled",
+            status=SimpleTextPage.PUBLISHED,
+            publication_date=now() + timedelta(hours=1),
+            author=self.user,
+        )
+        with tempfile.TemporaryDirectory() as output_dir, patch.object(
+            appsettings, "FLUENT_PAGES_SITEMAP_DIR", output_dir
+        ), patch.object(sitemaps, "SHARD_SIZE", 1):
+            path = os.path.join(
+                output_dir, str(site_id), "en-us", f"sitemap-{scheduled.pk}.xml.gz"
+            )
+            generate_sitemap_files(site_id)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(generate_sitemap_files(site_id), 0)
+
+            # Only the shard of the published page is regenerated.
+            later = now() + timedelta(hours=2)
+            with patch("fluent_pages.sitemaps.now", return_value=later), patch(
+                "fluent_pages.models.managers.now", return_value=later
+            ):
+                self.assertEqual(generate_sitemap_files(site_id), 1)
+                self.assertTrue(os.path.exists(path))
+                self.assertEqual(generate_sitemap_files(site_id), 0)
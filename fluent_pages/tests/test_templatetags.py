@@ -1,5 +1,11 @@
 import re
 
+from django.contrib.auth.models import AnonymousUser
+from django.template import Context, Template
+from django.test import RequestFactory
+from django.urls import set_script_prefix
+
+from fluent_pages.models.navigation import get_cached_navigation_tree
 from fluent_pages.tests.testapp.models import SimpleTextPage
 from fluent_pages.tests.utils import AppTestCase
 
@@ -59,3 +65,69 @@ class TemplateTagTests(AppTestCase):
             """]},"""
             """{'title':"Root2','url':"/root2/",'active':false},]""",
         )
+
+    def test_menu_prefetch(self):
+        """
+        The prefetch mode of the menu should render the same output.
+        """
+        template = Template(
+            '{% load fluent_pages_tags %}{% render_menu template="testapp/json_menu.html" %}'
+        )
+        request = RequestFactory().get("/404/")
+        request.user = AnonymousUser()
+        context = Context({"request": request})
+        expected = template.render(context)
+        self.assertIn("Level1a", expected)
+
+        template = Template(
+            "{% load fluent_pages_tags %}"
+            '{% render_menu template="testapp/json_menu.html" prefetch=True %}'
+        )
+        self.assertEqual(template.render(Context({"request": request})), expected)
+
+    def test_menu_cache(self):
+        """
+        The cached menu should render the same output, without running queries.
+        """
+        page = SimpleTextPage.objects.get(translations__slug="level1a")
+        request = RequestFactory().get(page.url)
+        request.user = AnonymousUser()
+
+        template = Template(
+            '{% load fluent_pages_tags %}{% render_menu template="testapp/json_menu.html" %}'
+        )
+        expected = template.render(Context({"request": request, "page": page}))
+        self.assertIn("'active': true", expected)
+
+        template = Template(
+            "{% load fluent_pages_tags %}"
+            '{% render_menu template="testapp/json_menu.html" cache=True %}'
+        )
+        self.assertEqual(template.render(Context({"request": request, "page": page})), expected)
+        with self.assertNumQueries(0):
+            output = template.render(Context({"request": request, "page": page}))
+        self.assertEqual(output, expected)
+
+        # Saving a page updates the cached menu.
+        SimpleTextPage.objects.create(
+            title="Root3",
+            slug="root3",
+            status=SimpleTextPage.PUBLISHED,
+            author=self.user,
+        )
+        output = template.render(Context({"request": request, "page": page}))
+        self.assertIn("Root3", output)
+
+    def test_menu_cache_key(self):
+        """
+        The cached menu should only hold the requested levels, and follow the script prefix.
+        """
+        self.assertEqual(len(get_cached_navigation_tree(max_depth=1)), 2)
+        self.assertGreater(len(get_cached_navigation_tree()), 2)
+
+        url = get_cached_navigation_tree().get_nodes()[0].url
+        set_script_prefix("/site/")
+        try:
+            self.assertEqual(get_cached_navigation_tree().get_nodes()[0].url, "/site" + url)
+        finally:
+            set_script_prefix("/")
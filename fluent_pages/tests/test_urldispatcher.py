@@ -1,11 +1,22 @@
+from unittest.mock import patch
+
 import django
-from django.test import override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, override_settings
 from django.urls import resolve, reverse
 
+from fluent_pages import appsettings
 from fluent_pages.models import Page, UrlNode
 from fluent_pages.tests.testapp.models import PlainTextFile, SimpleTextPage, WebShopPage
 from fluent_pages.tests.utils import AppTestCase, script_name
-from fluent_pages.views.dispatcher import _get_fallback_language, _try_languages
+from fluent_pages.views.dispatcher import (
+    CmsPageDispatcher,
+    _get_fallback_language,
+    _not_found_cache,
+    _try_languages,
+)
 
 
 class UrlDispatcherTests(AppTestCase):
@@ -338,3 +349,135 @@ class UrlDispatcherNonRootTests(AppTestCase):
             status_code=302,
             target_status_code=404,
         )
+
+
+@patch.object(appsettings, "FLUENT_PAGES_ROUTING_TABLE", True)
+class RoutingTableTests(AppTestCase):
+    """
+    Tests for resolving URLs via the in-process routing table.
+    """
+
+    @classmethod
+    def setUpTree(cls):
+        cls.home = SimpleTextPage.objects.create(
+            title="Home",
+            slug="home",
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+            override_url="/",
+        )
+        cls.sibling1 = SimpleTextPage.objects.create(
+            title="Text1",
+            slug="sibling1",
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+            contents="TEST_CONTENTS",
+        )
+        cls.shop = WebShopPage.objects.create(
+            title="Shop1", slug="shop", status=SimpleTextPage.PUBLISHED, author=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_for_path(self):
+        """
+        Pages should be found via the routing table, fetching only the node itself.
+        """
+        Page.objects.get_for_path("/")  # load table
+
+        with self.assertNumQueries(2):  # UrlNode + SimpleTextPage
+            sibling1 = Page.objects.get_for_path("/sibling1/")
+        self.assertEqual(sibling1.pk, self.sibling1.pk)
+
+        with self.assertNumQueries(0):
+            self.assertRaises(
+                Page.DoesNotExist, lambda: Page.objects.get_for_path("/not-found/")
+            )
+
+    def test_published(self):
+        """
+        The routing table should still honor the filters of the queryset.
+        """
+        SimpleTextPage.objects.create(
+            title="Text1", slug="unpublished", status=SimpleTextPage.DRAFT, author=self.user
+        )
+        self.assertTrue(Page.objects.get_for_path("/unpublished/"))
+        self.assertRaises(
+            Page.DoesNotExist, lambda: Page.objects.published().get_for_path("/unpublished/")
+        )
+        self.assert404("/unpublished/")
+
+    def test_invalidate_on_save(self):
+        """
+        Changing the URL of a page should reload the routing table.
+        """
+        self.assert200("/sibling1/")
+
+        sibling1 = Page.objects.get(pk=self.sibling1.pk)
+        sibling1.slug = "renamed"
+        sibling1.save()
+
+        self.assert404("/sibling1/")
+        self.assert200("/renamed/")
+
+        sibling1.delete()
+        self.assert404("/renamed/")
+
+    def test_best_match_for_path(self):
+        """
+        Pages with URL patterns should be found via the prefix-trie of the routing table.
+        """
+        qs = Page.objects.url_pattern_types()
+        self.assertEqual(qs.best_match_for_path("/shop/foo/bar/").pk, self.shop.pk)
+        self.assertEqual(qs.best_match_for_path("/shop/").pk, self.shop.pk)
+        self.assertRaises(Page.DoesNotExist, lambda: qs.best_match_for_path("/shop"))
+        self.assertRaises(Page.DoesNotExist, lambda: qs.best_match_for_path("/sibling1/foo/"))
+
+        with self.assertNumQueries(0):
+            self.assertRaises(Page.DoesNotExist, lambda: qs.best_match_for_path("/foo/bar/"))
+
+        response = self.client.get("/shop/foobar/")
+        self.assertContains(response, "test_webshop: article: foobar")
+
+
+@patch.object(appsettings, "FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT", 60)
+class NotFoundCacheTests(AppTestCase):
+    """
+    Tests for the negative-lookup cache of the dispatcher.
+    """
+
+    @classmethod
+    def setUpTree(cls):
+        cls.sibling1 = SimpleTextPage.objects.create(
+            title="Text1",
+            slug="sibling1",
+            status=SimpleTextPage.PUBLISHED,
+            author=cls.user,
+            contents="TEST_CONTENTS",
+        )
+
+    def setUp(self):
+        _not_found_cache.clear()
+
+    def test_not_found_cached(self):
+        """
+        A path that was not found before should not query the database again.
+        """
+        view = CmsPageDispatcher.as_view()
+        request = RequestFactory().get("/not-found/")
+        request.user = AnonymousUser()
+
+        self.assertRaises(Http404, lambda: view(request, path="not-found/"))
+        with self.assertNumQueries(0):
+            self.assertRaises(Http404, lambda: view(request, path="not-found/"))
+
+    def test_clear_on_save(self):
+        """
+        Adding a page should clear the cached 404 responses.
+        """
+        self.assert404("/new-page/")
+        SimpleTextPage.objects.create(
+            title="New", slug="new-page", status=SimpleTextPage.PUBLISHED, author=self.user
+        )
+        self.assert200("/new-page/")
@@ -1,10 +1,17 @@
 """
 URL Resolving for dynamically added pages.
 """
-from django.urls import NoReverseMatch, reverse
+import time
+from threading import local
+
+from django.core.signals import request_finished, request_started, setting_changed
+from django.urls import NoReverseMatch, get_script_prefix, get_urlconf, reverse
+from django.utils import translation
 from django.utils.functional import lazy
 from django.utils.translation import get_language
 
+from fluent_pages.signals import cache_version_changed
+
 # Several imports in this file are placed inline, to avoid loading the models too early.
 # Because fluent_pages.models creates a QuerySet, all all apps will be imported.
 # By reducing the import statements here, other apps (e.g. django-fluent-blogs) can already import this module safely.
@@ -72,13 +79,41 @@ def app_reverse(
 ):
     """
     Locate an URL which is located under a page type.
+
+    .. versionchanged:: 3.1 The results are remembered until the page tree changes.
     """
-    # Do a reverse on every possible page type that supports URLs
     args = args or []
     kwargs = kwargs or {}
+    if language_code is None:
+        language_code = get_language()
+
+    # Repeated calls (e.g. {% appurl %} in a listing) are a dictionary lookup.
+    memo_key = _get_memo_key(
+        viewname, args, kwargs, multiple, ignore_multiple, current_page, language_code
+    )
+    if memo_key is not None:
+        memo = _get_reverse_memo()
+        try:
+            result = memo[memo_key]
+        except KeyError:
+            result = _app_reverse(
+                viewname, args, kwargs, multiple, ignore_multiple, current_page, language_code
+            )
+            if multiple:
+                result = list(result)
+            if len(memo) >= _MEMO_SIZE:
+                memo.clear()
+            memo[memo_key] = result
+
+        return iter(result) if multiple else result
 
-    # Find the plugin
-    # TODO: allow more caching of the results
+    return _app_reverse(
+        viewname, args, kwargs, multiple, ignore_multiple, current_page, language_code
+    )
+
+
+def _app_reverse(viewname, args, kwargs, multiple, ignore_multiple, current_page, language_code):
+    # Find the plugin that provides the URL
     plugin, url_end = _find_plugin_reverse(viewname, args, kwargs)
     pages = _get_pages_of_type(plugin.model, language_code=language_code)
 
@@ -114,10 +149,135 @@ mixed_reverse_lazy = lazy(mixed_reverse, str)
 app_reverse_lazy = lazy(app_reverse, str)
 
 
+# Memoization of app_reverse() results.
+# Each process keeps the results per site, until the cache version changes.
+# During a request, the cache version is only checked once.
+# When the cache is not shared between processes, the results are only kept during the request,
+# as other processes wouldn't notice that the cache version changed.
+_MEMO_SIZE = 10000
+_memos = {}
+_request_memo = local()
+
+
+def _get_memo_key(viewname, args, kwargs, multiple, ignore_multiple, current_page, language_code):
+    # Only simple values are used, e.g. the URL of a model instance can depend on its fields.
+    values = list(args) + list(kwargs.values())
+    if not isinstance(viewname, str) or not all(isinstance(v, (str, int)) for v in values):
+        return None
+
+    return (
+        viewname,
+        tuple(str(arg) for arg in args),
+        tuple(sorted((key, str(value)) for key, value in kwargs.items())),
+        bool(multiple),
+        bool(ignore_multiple),
+        current_page.pk if current_page is not None else None,
+        language_code,
+        # The URLs include the root of the pages, which can differ per request.
+        get_urlconf(),
+        get_script_prefix(),
+    )
+
+
+def _get_reverse_memo():
+    """
+    Return the dictionary with remembered results for the current site and cache version.
+    """
+    from django.conf import settings
+
+    from fluent_pages.cache import (
+        PUBLICATION,
+        TREE,
+        get_cache_version,
+        get_publication_timeout,
+        is_cache_shared,
+    )
+
+    site_id = settings.SITE_ID
+    if getattr(_request_memo, "active", False):
+        memo = _request_memo.memos.get(site_id)
+        if memo is not None:
+            return memo
+
+    if not is_cache_shared():
+        memo = {}
+        if getattr(_request_memo, "active", False):
+            _request_memo.memos[site_id] = memo
+        return memo
+
+    version = get_cache_version(site_id, (TREE, PUBLICATION))
+    expires, memo_version, memo = _memos.get(site_id, (None, None, None))
+    is_expired = expires is not None and expires < time.monotonic()
+    if memo is None or memo_version != version or is_expired:
+        # The results can't be kept longer than the next publication change.
+        timeout = get_publication_timeout(site_id)
+        expires = time.monotonic() + timeout if timeout is not None else None
+        memo = {}
+        _memos[site_id] = (expires, version, memo)
+
+    if getattr(_request_memo, "active", False):
+        _request_memo.memos[site_id] = memo
+    return memo
+
+
+def _start_request_memo(**kwargs):
+    _request_memo.active = True
+    _request_memo.memos = {}
+
+
+def _end_request_memo(**kwargs):
+    _request_memo.active = False
+    _request_memo.memos = {}
+
+
+def _clear_request_memo(**kwargs):
+    # Called when the pages are changed by this thread, other requests see the new cache version.
+    _request_memo.memos = {}
+
+
+request_started.connect(_start_request_memo)
+request_finished.connect(_end_request_memo)
+cache_version_changed.connect(_clear_request_memo)
+
+
+# The URL where the pages are mounted, this depends on the URLconf and script prefix of the request.
+# Resolving it once avoids a full reverse() for every page URL that is generated.
+_url_roots = {}
+
+
+def _get_url_root(language_code):
+    """
+    Return the URL prefix of the pages in the given language, without the trailing slash.
+    The result is remembered per language, URLconf and script prefix.
+    """
+    from django.conf import settings
+
+    key = (language_code, get_urlconf() or settings.ROOT_URLCONF, get_script_prefix())
+    try:
+        return _url_roots[key]
+    except KeyError:
+        with translation.override(language_code):
+            root = reverse("fluent-page").rstrip("/")
+        if len(_url_roots) >= _MEMO_SIZE:
+            _url_roots.clear()
+        _url_roots[key] = root
+        return root
+
+
+def _clear_url_roots(setting, **kwargs):
+    # The settings that i18n_patterns() and the URLconf depend on, e.g. changed by tests.
+    if setting in ("ROOT_URLCONF", "LANGUAGE_CODE", "LANGUAGES"):
+        _url_roots.clear()
+
+
+setting_changed.connect(_clear_url_roots)
+
+
 def _find_plugin_reverse(viewname, args, kwargs):
     from fluent_pages.extensions import page_type_pool
 
-    plugins = page_type_pool.get_url_pattern_plugins()
+    # Only the plugins that provide the URL name have to be tried.
+    plugins = page_type_pool.get_url_pattern_plugins_for_name(viewname)
     for plugin in plugins:
         try:
             url_end = plugin.get_url_resolver().reverse(viewname, *args, **kwargs)
@@ -143,14 +303,18 @@ def _get_pages_of_type(model, language_code=None):
     from django.conf import settings
     from django.core.cache import cache
 
+    from fluent_pages.cache import PUBLICATION, TREE, get_cache_version, get_publication_timeout
     from fluent_pages.models.db import UrlNode
 
     if language_code is None:
         language_code = get_language()
 
     cachekey = f"fluent_pages.instance_of.{model.__name__}.{settings.SITE_ID}"
-    pages = cache.get(cachekey)
-    if not pages:
+    version = get_cache_version(settings.SITE_ID, (TREE, PUBLICATION))
+    value = cache.get(cachekey)
+    if value is not None and value[0] == version:
+        pages = value[1]
+    else:
         pages = (
             UrlNode.objects.published()
             .non_polymorphic()
@@ -162,9 +326,10 @@ def _get_pages_of_type(model, language_code=None):
             )
         )
 
-        # Short cache time of 1 hour, take into account that the publication date can affect this value.
+        # Cache until the publication date of a page changes the result, but at most an hour.
+        # Per-process cache backends don't notice the version changes of other processes.
         pages = list(pages)  # Make output consistent with non-cached version
-        cache.set(cachekey, pages, 3600)
+        cache.set(cachekey, (version, pages), get_publication_timeout(settings.SITE_ID, 3600))
 
     # Return in desired language
     # This is effectively what qs.language(..) does
@@ -186,10 +351,11 @@ def clear_app_reverse_cache():
     """
     Clear the cache for the :func:`app_reverse` function.
     This only has to be called when doing bulk update/delete actions that circumvent the individual model classes.
-    """
-    from django.core.cache import cache
 
-    from fluent_pages.extensions import page_type_pool
+    .. versionchanged:: 3.1 This expires the page tree caches of all sites,
+       see :func:`~fluent_pages.cache.increase_cache_version`.
+    """
+    from fluent_pages.cache import TREE, increase_cache_version
 
-    for model in page_type_pool.get_model_classes():
-        cache.delete(f"fluent_pages.instance_of.{model.__name__}")
+    increase_cache_version(scopes=(TREE,))
+    _memos.clear()
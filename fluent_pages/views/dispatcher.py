@@ -2,17 +2,22 @@
 The view to display CMS content.
 """
 import re
+import time
+from collections import OrderedDict
+from threading import Lock
 
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.http import Http404, HttpResponsePermanentRedirect, HttpResponseRedirect
-from django.template.response import TemplateResponse
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponsePermanentRedirect, HttpResponseRedirect
+from django.template.response import SimpleTemplateResponse, TemplateResponse
 from django.urls import NoReverseMatch, Resolver404, get_script_prefix, resolve, reverse
 from django.utils import translation
 from django.views.generic import RedirectView
 from django.views.generic.base import View
 
 from fluent_pages import appsettings
+from fluent_pages.cache import PUBLICATION, TREE, get_cache_version, get_publication_timeout
 from fluent_pages.models import UrlNode
 from fluent_pages.models.utils import prefill_parent_site
 
@@ -59,6 +64,11 @@ class CmsPageDispatcher(GetPathMixin, View):
         self.language_code = self.get_language()
         self.path = self.get_path()
 
+        # Avoid walking all resolvers again for paths that were not found before.
+        not_found_key = self._get_not_found_key()
+        if not_found_key is not None and _not_found_cache.contains(*not_found_key):
+            return self._page_not_found()
+
         # See which view returns a valid response.
         for func in (
             self._try_node,
@@ -70,6 +80,8 @@ class CmsPageDispatcher(GetPathMixin, View):
             if response is not None:
                 return response
 
+        if not_found_key is not None:
+            _not_found_cache.add(*not_found_key)
         return self._page_not_found()
 
     def post(self, request, **kwargs):
@@ -78,6 +90,23 @@ class CmsPageDispatcher(GetPathMixin, View):
         """
         return self.get(request, **kwargs)
 
+    def _get_not_found_key(self):
+        """
+        Return the key for the negative-lookup cache, or ``None`` when the result can't be cached.
+        """
+        if (
+            not appsettings.FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT
+            or not appsettings.FLUENT_PAGES_FILTER_SITE_ID
+        ):
+            return None
+
+        # Staff members can also see unpublished pages.
+        user = getattr(self.request, "user", None)
+        if user is not None and user.is_staff:
+            return None
+
+        return (settings.SITE_ID, self.language_code, self.path)
+
     def _page_not_found(self):
         # Since this view acts as a catch-all, give better error messages
         # when mistyping an admin URL. Don't mention anything about CMS pages in /admin.
@@ -93,7 +122,7 @@ class CmsPageDispatcher(GetPathMixin, View):
             # Admin might not be loaded.
             pass
 
-        if settings.DEBUG and self.model.objects.published().count() == 0 and self.path == "/":
+        if self.path == "/" and settings.DEBUG and self.model.objects.published().count() == 0:
             # No pages in the database, present nice homepage.
             return self._intro_page()
         else:
@@ -205,6 +234,20 @@ class CmsPageDispatcher(GetPathMixin, View):
         self.request._current_fluent_page = self.object
         prefill_parent_site(self.object)
 
+        # See if the page type allows caching the rendered output.
+        cache_key = plugin.get_cache_key(self.request, self.object)
+        if cache_key:
+            response = _get_cached_response(cache_key)
+            if response is not None:
+                return response
+
+            # Checking the user in get_cache_key() reads the session,
+            # only a session access of the page itself should prevent caching.
+            session = getattr(self.request, "session", None)
+            session_accessed = getattr(session, "accessed", False)
+            if session_accessed:
+                session.accessed = False
+
         # Let page type plugin handle the request.
         response = plugin.get_response(self.request, self.object)
         if response is None:
@@ -215,6 +258,10 @@ class CmsPageDispatcher(GetPathMixin, View):
                 )
             )
 
+        if cache_key:
+            timeout = plugin.get_cache_timeout(self.request, self.object)
+            _cache_response(self.request, response, cache_key, timeout, session_accessed)
+
         return response
 
     def _try_node_redirect(self):
@@ -386,6 +433,56 @@ def _is_accidental_fallback(obj, requested_language):
     )
 
 
+def _get_cached_response(cache_key):
+    """
+    Return the response that :func:`_cache_response` stored.
+    """
+    data = cache.get(cache_key)
+    if data is None:
+        return None
+
+    content, status_code, headers = data
+    response = HttpResponse(content, status=status_code)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def _cache_response(request, response, cache_key, timeout, session_accessed=False):
+    """
+    Store the rendered response, unless it's specific for the current visitor.
+    The ``session_accessed`` flag is restored afterwards, so the session middleware still sees it.
+    """
+
+    def _store(response):
+        session = getattr(request, "session", None)
+        try:
+            if (
+                not timeout
+                or response.status_code != 200
+                or response.streaming
+                or response.cookies
+                or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+                or request.META.get("CSRF_COOKIE_USED")
+                or getattr(session, "accessed", False)
+            ):
+                return
+
+            cache.set(
+                cache_key,
+                (response.content, response.status_code, list(response.items())),
+                timeout,
+            )
+        finally:
+            if session_accessed:
+                session.accessed = True
+
+    if isinstance(response, SimpleTemplateResponse) and not response.is_rendered:
+        response.add_post_render_callback(_store)
+    else:
+        _store(response)
+
+
 def _get_fallback_language(language_code):
     """
     Whether to try the default language.
@@ -397,3 +494,55 @@ def _get_fallback_language(language_code):
         return None
     else:
         return choices[-1]
+
+
+def _get_not_found_version(site_id):
+    # A path can resolve after a page is added, moved or published.
+    return get_cache_version(site_id, (TREE, PUBLICATION))
+
+
+class _NotFoundCache:
+    """
+    A bounded, in-process cache of paths that didn't resolve to a page.
+    Entries expire after :ref:`FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT` seconds,
+    or when the page tree of the site changes.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def contains(self, site_id, language_code, path):
+        key = (site_id, language_code, path)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+
+        expires, version = entry
+        if expires < time.monotonic() or version != _get_not_found_version(site_id):
+            with self._lock:
+                self._entries.pop(key, None)
+            return False
+
+        return True
+
+    def add(self, site_id, language_code, path):
+        key = (site_id, language_code, path)
+        # A scheduled page could become visible before the timeout ends.
+        timeout = get_publication_timeout(
+            site_id, appsettings.FLUENT_PAGES_NOT_FOUND_CACHE_TIMEOUT
+        )
+        expires = time.monotonic() + timeout
+        version = _get_not_found_version(site_id)
+        with self._lock:
+            self._entries[key] = (expires, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > appsettings.FLUENT_PAGES_NOT_FOUND_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_not_found_cache = _NotFoundCache()